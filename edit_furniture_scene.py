@@ -14,6 +14,7 @@ import sys
 
 def main():
     """Main processing function"""
+    services.configure_logging()
     print("=" * 70)
     print("🪑 FURNITURE SCENE GENERATOR - Overstock White Label Project")
     print("=" * 70)
@@ -28,6 +29,7 @@ def main():
         vision_client, imagen_model = services.initialize_google_clients()
         print("✓ Clients initialized")
 
+        llm.warm_models()
         agent = llm.create_stage1_agent()
         
 
@@ -82,7 +84,7 @@ def main():
                 
                 for img_copy_no in range(1,copies + 1):
                     # Step 3: Generate room scene
-                    output_filename = f"{wl_model}_room_edit_{img_copy_no}.png"
+                    output_filename = f"{wl_model}_room_edit_{img_copy_no}.jpg"
                     local_output_path = output_dir / output_filename
                     services.generate_room_scene_with_agent(agent, prompt, product_data, str(local_output_path))
                     
@@ -20,6 +20,10 @@ EXCEL_EDITED_INPUT_PATH = os.getenv('EXCEL_EDITED_INPUT_PATH', './Overstock_Whit
 
 EXCEL_OUTPUT_PATH = os.getenv('EXCEL_OUTPUT_PATH', './output/Overstock White Label Project 093025_updated.xlsx')
 EXCEL_EDITED_OUTPUT_PATH = os.getenv('EXCEL_EDITED_OUTPUT_PATH', './output/Overstock White Label Project 093025_edited.xlsx')
+# CSV of (WL, Lifestyle Image) rows appended after every upload; used to resume interrupted runs.
+# Named after the input workbook so a checkpoint is never applied to a different sheet
+PROGRESS_CHECKPOINT_PATH = os.getenv('PROGRESS_CHECKPOINT_PATH', os.path.join(
+    './output', os.path.splitext(os.path.basename(EXCEL_INPUT_PATH))[0] + '.progress.csv'))
 
 SFTP_HOST = os.getenv('SFTP_HOST')
 SFTP_PORT = int(os.getenv('SFTP_PORT', 22))
@@ -27,3 +31,34 @@ SFTP_USERNAME = os.getenv('SFTP_USERNAME')
 SFTP_PASSWORD = os.getenv('SFTP_PASSWORD')
 SFTP_REMOTE_PATH = os.getenv('SFTP_REMOTE_PATH')
 SFTP_BASE_URL = os.getenv('SFTP_BASE_URL')
+
+# Comma-separated Vision API feature types requested per product image (e.g. add WEB_DETECTION to compare)
+VISION_FEATURES = [name.strip().upper() for name in os.getenv(
+    'VISION_FEATURES', 'LABEL_DETECTION,IMAGE_PROPERTIES,OBJECT_LOCALIZATION').split(',') if name.strip()]
+VISION_LABEL_MAX_RESULTS = int(os.getenv('VISION_LABEL_MAX_RESULTS', 8))
+
+# Pick the same room context for a given furniture type on every run instead of a random one
+DETERMINISTIC_ROOM_CONTEXT = os.getenv('DETERMINISTIC_ROOM_CONTEXT', 'false').lower() in ('1', 'true', 'yes')
+# Number of SFTP sessions kept open for uploads by furniture_scene_python.py
+SFTP_POOL_SIZE = int(os.getenv('SFTP_POOL_SIZE', 8))
+
+PROMPT_CACHE_DIR = os.getenv('PROMPT_CACHE_DIR', './.cache/prompts')
+# Memory budget (MB) for downloaded images kept in-process for reuse
+IMAGE_MEMORY_CACHE_MB = int(os.getenv('IMAGE_MEMORY_CACHE_MB', 256))
+# On-disk cache of encoded image data URLs and Vision analyses, reused across runs
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', './.cache/images')
+IMAGE_CACHE_EXPIRE = int(os.getenv('IMAGE_CACHE_EXPIRE', 7 * 24 * 3600))
+# Prompts longer than this that mention lighting/style details skip the LLM improvement step
+PROMPT_IMPROVE_MIN_LEN = int(os.getenv('PROMPT_IMPROVE_MIN_LEN', 400))
+# Prompts up to this length are rewritten by the lighter chat model
+PROMPT_LIGHT_MODEL = os.getenv('PROMPT_LIGHT_MODEL', 'gemini-2.5-flash-lite')
+PROMPT_LIGHT_MODEL_MAX_LEN = int(os.getenv('PROMPT_LIGHT_MODEL_MAX_LEN', 200))
+# Output cap for prompt improvement only; thinking tokens count against it, so thinking is off by default
+PROMPT_MAX_OUTPUT_TOKENS = int(os.getenv('PROMPT_MAX_OUTPUT_TOKENS', 1024))
+PROMPT_THINKING_BUDGET = int(os.getenv('PROMPT_THINKING_BUDGET', 0))
+
+# Number of products processed at the same time by furniture_scene_python.py
+MAX_CONCURRENT_PRODUCTS = int(os.getenv('MAX_CONCURRENT_PRODUCTS', 4))
+# Workers for the image prefetch and SFTP upload stages around generation
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 4))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 4))
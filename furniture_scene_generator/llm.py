@@ -1,19 +1,84 @@
+import functools
+import hashlib
+import logging
+import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from furniture_scene_generator import services, schema, config
 
+import diskcache
 from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.language_models import BaseChatModel
-from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 
 
-def create_chat_model():
+logger = logging.getLogger(__name__)
+
+
+_IMPROVE_TMPL = textwrap.dedent("""\
+    You are an expert at writing image editing prompts for furniture and home decor products.
+    Improve the following prompt to be more detailed and specific for better image editing results.
+
+    {product_context}
+
+    Original prompt: {original_prompt}
+
+    Instructions:
+    1. Keep the core intent of placing the furniture in an appropriate room scene
+    2. Add artistic details about lighting, color harmony, and atmosphere
+    3. Describe the room style that would best showcase this product
+    4. Include quality descriptors (photorealistic, high-resolution, professional)
+    5. Focus on elements that would attract customers to buy this item
+    6. Consider the price point when describing the room setting
+    7. Emphasize the furniture as the focal point while creating an aspirational scene
+
+    Provide ONLY the improved prompt, nothing else. Do not include any preamble or explanation.""")
+
+# Words that suggest a long prompt already covers what the improvement step would add
+_DETAILED_PROMPT_KEYWORDS = ("lighting", "photorealistic", "style")
+
+_REEDIT_TMPL = textwrap.dedent("""\
+    Here are two images. The first image is a product image. The second image is a lifestyle image showing the product in a room setting. The second image needs to be edited and the first image is provided as a product reference. Only make changes that were specifically requested.
+
+    {product_context}
+
+    Edit Request: {original_prompt}
+
+    Draft Edit Prompt: {base_prompt}
+
+    Instructions:
+    - Refine the draft edit prompt above to be more clear, specific, and actionable for an image editing model. The edit request is the primary guide, but use the product information and image details to enhance the prompt.
+    - Use the first image only as a product reference for the edit.
+    - Do not change the overall room layout, lighting, or background style unless specifically requested.
+    - Focus on the requested changes and ensure the product remains realistic and well-integrated in the scene.
+    - Provide ONLY the improved prompt for the image editing model, nothing else. Do not include any preamble or explanation.
+    - Ensure the final prompt is concise while still being detailed and specific.""")
+
+# Parsed once at import; nodes only substitute the variables per call
+_IMPROVE_PROMPT = ChatPromptTemplate.from_template(_IMPROVE_TMPL)
+_REEDIT_PROMPT = ChatPromptTemplate.from_template(_REEDIT_TMPL)
+
+
+def create_chat_model(model_name: str = "gemini-2.5-flash", max_output_tokens: Optional[int] = None,
+                      thinking_budget: Optional[int] = None):
+    # Only pass limits that were asked for, so the model's own defaults apply otherwise
+    limits = {}
+    if max_output_tokens is not None:
+        limits['max_output_tokens'] = max_output_tokens
+    if thinking_budget is not None:
+        limits['thinking_budget'] = thinking_budget
     model = init_chat_model(
-        model="gemini-2.5-flash",  # Updated to 2.5
+        model=model_name,
         model_provider="google_vertexai",
         project=config.PROJECT_ID,
-        location=config.LOCATION)
+        location=config.LOCATION,
+        **limits)
     return model
 
 
@@ -26,36 +91,76 @@ def create_image_chat_model():
     return model
 
 
-_chat_model: Optional[BaseChatModel] = None
+_chat_models: dict[tuple, BaseChatModel] = {}
 _image_model: Optional[BaseChatModel] = None
+_model_lock = threading.Lock()
+_prompt_cache: Optional[diskcache.Cache] = None
+
 
+def get_chat_model(model_name: str = "gemini-2.5-flash", max_output_tokens: Optional[int] = None,
+                   thinking_budget: Optional[int] = None):
+    key = (model_name, max_output_tokens, thinking_budget)
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        with _model_lock:
+            chat_model = _chat_models.get(key)
+            if chat_model is None:
+                chat_model = _chat_models[key] = create_chat_model(
+                    model_name, max_output_tokens=max_output_tokens, thinking_budget=thinking_budget)
+    return chat_model
 
-def get_chat_model():
-    global _chat_model
-    if _chat_model is None:
-        _chat_model = create_chat_model()
-    return _chat_model
+
+def get_prompt_model(model_name: str = "gemini-2.5-flash"):
+    """Chat model for the prompt improvement step, with its output length and thinking capped"""
+    return get_chat_model(model_name,
+                          max_output_tokens=config.PROMPT_MAX_OUTPUT_TOKENS,
+                          thinking_budget=config.PROMPT_THINKING_BUDGET)
 
 
 def get_image_model():
     global _image_model
     if _image_model is None:
-        _image_model = create_image_chat_model()
+        with _model_lock:
+            if _image_model is None:
+                _image_model = create_image_chat_model()
     return _image_model
 
 
-def analyze_images_for_prompt_node(state: schema.ImageEditState) -> schema.ImageEditState:
+def warm_models():
+    """Create the models up front so the first graph run doesn't pay for client setup"""
+    get_chat_model()
+    get_prompt_model()
+    get_prompt_model(config.PROMPT_LIGHT_MODEL)
+    get_image_model()
+
+
+def _fetch_two(urls: list[str]) -> list[dict]:
+    """Fetch two image URLs concurrently and return their image_url message parts."""
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        return list(ex.map(services.image_url_to_message, urls))
+
+
+def prepare_images_node(state: schema.ImageEditState) -> dict:
+    """Fetch and encode the product and lifestyle images once for the stage 2 nodes"""
+    logger.info("📥 Preparing reference images...")
+
+    product = state['product_data']
+    silo_msg, life_msg = _fetch_two([product.silo_image, product.lifestyle_image])
+    return {'silo_message': silo_msg, 'lifestyle_message': life_msg}
+
+
+def analyze_images_for_prompt_node(state: schema.ImageEditState) -> dict:
     """Use image_model to analyze the product and lifestyle images and improve the original prompt for editing the lifestyle image using the product image as reference."""
-    print("Analyzing images to improve edit prompt...")
+    logger.info("Analyzing images to improve edit prompt...")
 
     product = state['product_data']
     original_prompt = state['original_prompt']
     # Build a multimodal message sequence for the image model
     analyze_message = HumanMessage(content=[
         {"type": "text", "text": "Product reference image:"},
-        services.image_url_to_message(product.silo_image),
+        state['silo_message'],
         {"type": "text", "text": "Lifestyle image to edit:"},
-        services.image_url_to_message(product.lifestyle_image),
+        state['lifestyle_message'],
         {"type": "text", "text": (
             "Here are two images. The first image is a product image. The second image is a lifestyle image showing the product in a room setting. "
             "The second image needs to be edited and the first image is provided as a product reference. "
@@ -70,129 +175,215 @@ def analyze_images_for_prompt_node(state: schema.ImageEditState) -> schema.Image
     try:
         image_model = get_image_model()
         response = image_model.invoke([analyze_message])
-        prompt = response.content.strip() if isinstance(response.content, str) else str(response.content)
-        print(f"✓ Improved edit prompt ({len(prompt)} chars)")
-        print(f"  Prompt With Analysis: {prompt}")
-        state['improved_prompt'] = prompt
+        prompt = services.message_text(response.content).strip()
+        logger.info(f"✓ Improved edit prompt ({len(prompt)} chars)")
+        logger.debug("  Prompt With Analysis: %s", prompt)
+        return {'improved_prompt': prompt}
     except Exception as e:
-        print(f"⚠️ Image analysis for prompt failed: {str(e)}")
-        state['improved_prompt'] = original_prompt
-        state['error'] = str(e)
+        logger.warning(f"⚠️ Image analysis for prompt failed: {str(e)}")
+        return {'improved_prompt': original_prompt, 'error': str(e)}
+
+
+def _product_context(model: str, retail, website_link: Optional[str]) -> str:
+    """Product details shared by the prompt improvement and refinement templates"""
+    product_page = f"\n- Product Page: {website_link}" if website_link else ""
+    return (
+        "Product Information:\n"
+        f"- Model: {model}\n"
+        f"- Retail Price: ${retail if retail else 'N/A'}\n"
+        f"- Style/Category: Based on the product images and context{product_page}"
+    )
 
-    return state
 
+@functools.lru_cache(maxsize=1024)
+def _improve_prompt_messages_for(model: str, retail, website_link: Optional[str], original_prompt: str) -> tuple[BaseMessage, ...]:
+    return tuple(_IMPROVE_PROMPT.format_messages(
+        product_context=_product_context(model, retail, website_link),
+        original_prompt=original_prompt))
 
-# Define the workflow nodes
-def improve_prompt_node(state: schema.ImageEditState) -> schema.ImageEditState:
-    """Use chat_model to improve the image editing prompt"""
-    print("📝 Improving prompt...")
 
-    # Extract product data for context
+def _improve_prompt_messages(state: schema.ImageEditState) -> list[BaseMessage]:
+    """Build the chat messages asking for an improved version of the state's prompt"""
     product = state['product_data']
+    return list(_improve_prompt_messages_for(
+        product.model, product.retail, product.website_link_for_context, state['original_prompt']))
+
+
+def get_prompt_cache() -> diskcache.Cache:
+    """On-disk cache of improved prompts, shared across runs"""
+    global _prompt_cache
+    if _prompt_cache is None:
+        with _model_lock:
+            if _prompt_cache is None:
+                _prompt_cache = diskcache.Cache(config.PROMPT_CACHE_DIR)
+    return _prompt_cache
+
+
+def _prompt_cache_key(model: str, prompt_text: str) -> str:
+    # The project version is part of the key so template changes invalidate old entries
+    return hashlib.blake2b(f"{config.PROJECT_VERSION}|{model}|{prompt_text}".encode()).hexdigest()
+
+
+def _is_detailed_prompt(prompt: str) -> bool:
+    """Cheap check for prompts that are already specific enough to use as-is"""
+    if len(prompt) <= config.PROMPT_IMPROVE_MIN_LEN:
+        return False
+    lowered = prompt.lower()
+    return any(keyword in lowered for keyword in _DETAILED_PROMPT_KEYWORDS)
+
+
+def _prompt_model_name(prompt: str) -> str:
+    if len(prompt) <= config.PROMPT_LIGHT_MODEL_MAX_LEN:
+        return config.PROMPT_LIGHT_MODEL
+    return "gemini-2.5-flash"
+
+
+def _state_prompt_model(state: schema.ImageEditState):
+    # Short prompts are simple rewrites, so they go to the lighter model
+    return get_prompt_model(_prompt_model_name(state['original_prompt']))
+
+
+def _plan_prompt_improvement(state: schema.ImageEditState) -> tuple[Optional[dict], Optional[str], list[BaseMessage]]:
+    """Return (update, None, None) when no model call is needed, else (None, cache key, messages)
+
+    Shared by improve_prompts and the improve_prompt nodes, which differ only in how they call the model.
+    """
+    if _is_detailed_prompt(state['original_prompt']):
+        logger.info("✓ Prompt is already detailed, skipping improvement")
+        return {'improved_prompt': state['original_prompt']}, None, None
+    messages = _improve_prompt_messages(state)
+    key = _prompt_cache_key(state['product_data'].model, messages[0].content)
+    cached = get_prompt_cache().get(key)
+    # Empty entries (left by older versions) are treated as misses
+    if cached:
+        logger.info(f"✓ Using cached improved prompt ({len(cached)} chars)")
+        return {'improved_prompt': cached}, None, None
+    return None, key, messages
+
+
+def _improved_prompt_update(state: schema.ImageEditState, key: str, result) -> dict:
+    """Turn a model result (text or exception) into a state update, caching non-empty successes"""
+    if isinstance(result, Exception):
+        logger.warning(f"⚠️ Prompt improvement failed: {str(result)}")
+        return {'improved_prompt': state['original_prompt'], 'error': str(result)}
+    improved = result.strip()
+    if not improved:
+        logger.warning("⚠️ Prompt improvement returned an empty reply, using the original prompt")
+        return {'improved_prompt': state['original_prompt']}
+    logger.info(f"✓ Improved prompt ({len(improved)} chars)")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"  Preview: {improved[:150]}...")
+    get_prompt_cache().set(key, improved)
+    return {'improved_prompt': improved}
+
+
+def improve_prompts(states: list[schema.ImageEditState], max_concurrency: int = 8) -> list[dict]:
+    """Improve the prompts of several states with one batched chat_model call per prompt model.
+
+    Prompts that are already detailed or cached are not sent; new results go into the
+    prompt cache, so the graph's improve_prompt node finds them there afterwards.
+    Returns one state update per input state, in the same order.
+    """
+    logger.info(f"📝 Improving {len(states)} prompt(s)...")
+
+    updates: list[Optional[dict]] = [None] * len(states)
+    by_model: dict[str, list] = {}
+    for i, state in enumerate(states):
+        update, key, messages = _plan_prompt_improvement(state)
+        if update is not None:
+            updates[i] = update
+        else:
+            # Short prompts go to the lighter model, in a batch of their own
+            by_model.setdefault(_prompt_model_name(state['original_prompt']), []).append((i, key, messages))
+
+    for model_name, items in by_model.items():
+        try:
+            responses = get_prompt_model(model_name).batch(
+                [messages for _, _, messages in items],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True)
+        except Exception as e:
+            responses = [e] * len(items)
+        for (i, key, _), response in zip(items, responses):
+            result = response if isinstance(response, Exception) else services.message_text(response.content)
+            updates[i] = _improved_prompt_update(states[i], key, result)
+
+    return updates
 
-    # Build product context string
-    product_context = f"""
-Product Information:
-- Model: {product.model}
-- Retail Price: ${product.retail if product.retail else 'N/A'}
-- Style/Category: Based on the product images and context
-"""
 
-    if product.website_link_for_context:
-        product_context += f"- Product Page: {product.website_link_for_context}\n"
+# Define the workflow nodes
+def improve_prompt_node(state: schema.ImageEditState) -> dict:
+    """Use chat_model to improve the image editing prompt, streaming the response"""
+    logger.info("📝 Improving prompt...")
 
-    improvement_message = HumanMessage(
-        content=f"""You are an expert at writing image editing prompts for furniture and home decor products.
-Improve the following prompt to be more detailed and specific for better image editing results.
+    update, key, messages = _plan_prompt_improvement(state)
+    if update is not None:
+        return update
 
-{product_context}
+    try:
+        chat_model = _state_prompt_model(state)
+        result = "".join(services.message_text(chunk.content) for chunk in chat_model.stream(messages))
+    except Exception as e:
+        result = e
+    return _improved_prompt_update(state, key, result)
 
-Original prompt: {state['original_prompt']}
 
-Instructions:
-1. Keep the core intent of placing the furniture in an appropriate room scene
-2. Add artistic details about lighting, color harmony, and atmosphere
-3. Describe the room style that would best showcase this product
-4. Include quality descriptors (photorealistic, high-resolution, professional)
-5. Focus on elements that would attract customers to buy this item
-6. Consider the price point when describing the room setting
-7. Emphasize the furniture as the focal point while creating an aspirational scene
+async def aimprove_prompt_node(state: schema.ImageEditState) -> dict:
+    """Async variant of improve_prompt_node used when the graph runs under ainvoke/abatch"""
+    logger.info("📝 Improving prompt...")
 
-Provide ONLY the improved prompt, nothing else. Do not include any preamble or explanation."""
-    )
+    update, key, messages = _plan_prompt_improvement(state)
+    if update is not None:
+        return update
 
     try:
-        chat_model = get_chat_model()
-        response = chat_model.invoke([improvement_message])
-        improved = response.content.strip()
-        print(f"✓ Improved prompt ({len(improved)} chars)")
-        print(f"  Preview: {improved[:150]}...")
-        state['improved_prompt'] = improved
+        chat_model = _state_prompt_model(state)
+        result = "".join([services.message_text(chunk.content) async for chunk in chat_model.astream(messages)])
     except Exception as e:
-        print(f"⚠️ Prompt improvement failed: {str(e)}")
-        state['improved_prompt'] = state['original_prompt']
-        state['error'] = str(e)
-
-    return state
+        result = e
+    return _improved_prompt_update(state, key, result)
 
 
-
-def improve_reedit_prompt_node(state: schema.ImageEditState) -> schema.ImageEditState:
+def improve_reedit_prompt_node(state: schema.ImageEditState) -> dict:
     """Use chat_model to refine the prompt generated by analyze_images_for_prompt for editing a lifestyle image using a product reference image."""
-    print("📝 Refining edit prompt...")
+    logger.info("📝 Refining edit prompt...")
 
     product = state['product_data']
-    # Compose a clear, editing-focused context
-    product_context = f"""
-Product Information:
-- Model: {product.model}
-- Retail Price: ${product.retail if product.retail else 'N/A'}
-- Style/Category: Based on the product images and context
-"""
-    if product.website_link_for_context:
-        product_context += f"- Product Page: {product.website_link_for_context}\n"
 
     # Use the improved_prompt from analyze_images_for_prompt as the base prompt to refine
     base_prompt = state['improved_prompt'] if state['improved_prompt'] else state['original_prompt']
 
-    improvement_message = HumanMessage(
-        content=f"""
-Here are two images. The first image is a product image. The second image is a lifestyle image showing the product in a room setting. The second image needs to be edited and the first image is provided as a product reference. Only make changes that were specifically requested.
-
-{product_context}
+    improvement_messages = _REEDIT_PROMPT.format_messages(
+        product_context=_product_context(product.model, product.retail, product.website_link_for_context),
+        original_prompt=state['original_prompt'],
+        base_prompt=base_prompt)
 
-Edit Request: {state['original_prompt']}
-
-Draft Edit Prompt: {base_prompt}
-
-Instructions:
-- Refine the draft edit prompt above to be more clear, specific, and actionable for an image editing model. The edit request is the primary guide, but use the product information and image details to enhance the prompt.
-- Use the first image only as a product reference for the edit.
-- Do not change the overall room layout, lighting, or background style unless specifically requested.
-- Focus on the requested changes and ensure the product remains realistic and well-integrated in the scene.
-- Provide ONLY the improved prompt for the image editing model, nothing else. Do not include any preamble or explanation.
-- Ensure the final prompt is concise while still being detailed and specific.
-"""
-    )
+    cache = get_prompt_cache()
+    key = _prompt_cache_key(product.model, improvement_messages[0].content)
+    cached = cache.get(key)
+    if cached:
+        logger.info(f"✓ Using cached refined edit prompt ({len(cached)} chars)")
+        return {'improved_prompt': cached}
 
     try:
         chat_model = get_chat_model()
-        response = chat_model.invoke([improvement_message])
-        improved = response.content.strip()
-        print(f"✓ Refined edit prompt ({len(improved)} chars)")
-        print(f"  Final Prompt: {improved}...")
-        state['improved_prompt'] = improved
+        response = chat_model.invoke(improvement_messages)
+        improved = services.message_text(response.content).strip()
+        if not improved:
+            logger.warning("⚠️ Prompt refinement returned an empty reply, using the base prompt")
+            return {'improved_prompt': base_prompt}
+        logger.info(f"✓ Refined edit prompt ({len(improved)} chars)")
+        logger.debug("  Final Prompt: %s", improved)
+        cache.set(key, improved)
+        return {'improved_prompt': improved}
     except Exception as e:
-        print(f"⚠️ Prompt refinement failed: {str(e)}")
-        state['improved_prompt'] = base_prompt
-        state['error'] = str(e)
-
-    return state
+        logger.warning(f"⚠️ Prompt refinement failed: {str(e)}")
+        return {'improved_prompt': base_prompt, 'error': str(e)}
 
 
-def edit_image_node(state: schema.ImageEditState) -> schema.ImageEditState:
+def edit_image_node(state: schema.ImageEditState) -> dict:
     """Use image_model to edit the image with the improved prompt"""
-    print("🎨 Editing image...")
+    logger.info("🎨 Editing image...")
 
     image_data = state['source_image_data']
     mime_type = state['source_image_mime_type']
@@ -208,31 +399,29 @@ def edit_image_node(state: schema.ImageEditState) -> schema.ImageEditState:
     try:
         image_model = get_image_model()
         response = image_model.invoke([edit_message])
-        print("✓ Image edited successfully")
-        print(f"  Response type: {type(response)}")
-        print(f"  Content preview: {str(response.content)[:200]}...")
-        state['response'] = response
+        logger.info("✓ Image edited successfully")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"  Response type: {type(response)}")
+            logger.debug(f"  Content preview: {services.message_text(response.content)[:200] or '<non-text>'}...")
+        return {'response': response}
     except Exception as e:
-        print(f"⚠️ Image editing failed: {str(e)}")
-        state['error'] = str(e)
-        state['response'] = None
+        logger.warning(f"⚠️ Image editing failed: {str(e)}")
+        return {'response': None, 'error': str(e)}
 
-    return state
 
 
 
 
-
-def reedit_image_node(state: schema.ImageEditState) -> schema.ImageEditState:
+def reedit_image_node(state: schema.ImageEditState) -> dict:
     """Use image_model to edit the image with the improved prompt"""
-    print(" Editing image...")
+    logger.info(" Editing image...")
 
     # Build a more explicit multimodal message sequence
     edit_message = HumanMessage(content=[
         {"type": "text", "text": "Product reference image:"},
-        services.image_url_to_message(state['product_data'].silo_image),
+        state['silo_message'],
         {"type": "text", "text": "Lifestyle image to edit:"},
-        services.image_url_to_message(state['product_data'].lifestyle_image),
+        state['lifestyle_message'],
         {"type": "text", "text": (
             "The first image is the PRODUCT REFERENCE. "
             "The second image is the LIFESTYLE IMAGE that needs to be edited. "
@@ -245,75 +434,111 @@ def reedit_image_node(state: schema.ImageEditState) -> schema.ImageEditState:
     try:
         image_model = get_image_model()
         response = image_model.invoke([edit_message])
-        print("✓ Image edited successfully")
-        print(f"  Response type: {type(response)}")
-        print(f"  Content preview: {str(response.content)[:200]}...")
-        state['response'] = response
+        logger.info("✓ Image edited successfully")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"  Response type: {type(response)}")
+            logger.debug(f"  Content preview: {services.message_text(response.content)[:200] or '<non-text>'}...")
+        return {'response': response}
     except Exception as e:
-        print(f" Image editing failed: {str(e)}")
-        state['error'] = str(e)
-        state['response'] = None
+        logger.warning(f" Image editing failed: {str(e)}")
+        return {'response': None, 'error': str(e)}
+
 
-    return state
+def _loaded_image_update(image_data: dict) -> dict:
+    logger.info(
+        f"✓ Image loaded successfully ({len(image_data['image_data'])} bytes, MIME type: {image_data['mime_type']})")
+    return {
+        'source_image_data': image_data['image_data'],
+        'source_image_mime_type': image_data['mime_type'],
+    }
 
 
-def load_image_node(state: schema.ImageEditState) -> schema.ImageEditState:
+def _load_image_failed_update(e: Exception) -> dict:
+    logger.warning(f"⚠️ Failed to load image: {str(e)}")
+    return {
+        'source_image_data': None,
+        'source_image_mime_type': None,
+        'error': str(e),
+    }
+
+
+def load_image_node(state: schema.ImageEditState) -> dict:
     """Load the source image data from the URL"""
-    print("📥 Loading source image...")
+    logger.info("📥 Loading source image...")
+    try:
+        return _loaded_image_update(services.get_image_url_data(state['product_data'].silo_image))
+    except Exception as e:
+        return _load_image_failed_update(e)
+
+
+async def aload_image_node(state: schema.ImageEditState) -> dict:
+    """Async variant of load_image_node used when the graph runs under ainvoke/abatch"""
+    logger.info("📥 Loading source image...")
     try:
-        image_data = services.get_image_url_data(
-            state['product_data'].silo_image)
-        state['source_image_data'] = image_data['image_data']
-        state['source_image_mime_type'] = image_data['mime_type']
-        print(
-            f"✓ Image loaded successfully ({len(image_data['image_data'])} bytes, MIME type: {image_data['mime_type']})")
+        return _loaded_image_update(await services.get_image_url_data_async(state['product_data'].silo_image))
     except Exception as e:
-        print(f"⚠️ Failed to load image: {str(e)}")
-        state['error'] = str(e)
-        state['source_image_data'] = None
-        state['source_image_mime_type'] = None
-    return state
+        return _load_image_failed_update(e)
 
 
-def resize_image_node(state: schema.ImageEditState) -> schema.ImageEditState:
+def resize_image_node(state: schema.ImageEditState) -> dict:
     """Resize the source image to target dimensions"""
-    print("🔄 Resizing source image...")
+    logger.info("🔄 Resizing source image...")
 
     if state.get('target_width', None) is None and state.get('target_height', None) is None:
-        print("  ⏭️ No target dimensions specified, skipping resizing.")
-        return state
+        logger.info("  ⏭️ No target dimensions specified, skipping resizing.")
+        return {}
 
     try:
         target_width = state.get('target_width', 1024)
         target_height = state.get('target_height', 1024)
+        upload_mime = "image/jpeg"
         resized_image_data = services.pad_and_resize_image(
             image_data=state['source_image_data'],
             mime_type=state['source_image_mime_type'],
             target_width=target_width,
-            target_height=target_height
+            target_height=target_height,
+            upload_mime=upload_mime
         )
-        state['source_image_data'] = resized_image_data
-        print(f"✓ Image resized to {target_width}x{target_height} pixels")
+        logger.info(f"✓ Image resized to {target_width}x{target_height} pixels")
+        return {'source_image_data': resized_image_data, 'source_image_mime_type': upload_mime}
     except Exception as e:
-        print(f"⚠️ Image resizing failed: {str(e)}")
-        state['error'] = str(e)
-    return state
+        logger.warning(f"⚠️ Image resizing failed: {str(e)}")
+        return {'error': str(e)}
+
 
+def fan_out_stage1(state: schema.ImageEditState) -> list[Send]:
+    """Run the prompt improvement and the source image branch in parallel."""
+    return [Send("improve_prompt", state), Send("load_image", state)]
 
+
+def route_after_load_image(state: schema.ImageEditState) -> str:
+    """Skip the resize node entirely when no target dimensions are set."""
+    if state.get('target_width') or state.get('target_height'):
+        return "resize_image"
+    return "edit_image"
+
+
+# The compiled graphs are built once per process and shared by every caller,
+# so node functions must not keep per-run state in closures or globals.
+@functools.lru_cache(maxsize=1)
 def create_stage1_agent():
     # Build the workflow graph
     workflow = StateGraph(schema.ImageEditState)
 
     # Add nodes
-    workflow.add_node("improve_prompt", improve_prompt_node)
-    workflow.add_node("load_image", load_image_node)
+    workflow.add_node("improve_prompt", RunnableLambda(improve_prompt_node, afunc=aimprove_prompt_node))
+    workflow.add_node("load_image", RunnableLambda(load_image_node, afunc=aload_image_node))
     workflow.add_node("resize_image", resize_image_node)
-    workflow.add_node("edit_image", edit_image_node)
-
-    # Define the flow
-    workflow.set_entry_point("improve_prompt")
-    workflow.add_edge("improve_prompt", "load_image")
-    workflow.add_edge("load_image", "resize_image")
+    # Deferred so it runs once, after both branches finish, whichever path the image branch takes
+    workflow.add_node("edit_image", edit_image_node, defer=True)
+
+    # Define the flow: prompt improvement and image loading are independent,
+    # so fan out from START and join both branches before editing
+    workflow.add_conditional_edges(START, fan_out_stage1, ["improve_prompt", "load_image"])
+    workflow.add_conditional_edges(
+        "load_image", route_after_load_image,
+        {"resize_image": "resize_image", "edit_image": "edit_image"})
+    workflow.add_edge("improve_prompt", "edit_image")
     workflow.add_edge("resize_image", "edit_image")
     workflow.add_edge("edit_image", END)
 
@@ -322,20 +547,35 @@ def create_stage1_agent():
     return app
 
 
+@functools.lru_cache(maxsize=1)
 def create_stage2_agent():
     workflow = StateGraph(schema.ImageEditState)
 
     # Add nodes
-
+    workflow.add_node("prepare_images", prepare_images_node)
     workflow.add_node("analyze_image", analyze_images_for_prompt_node)
     workflow.add_node("improve_prompt", improve_reedit_prompt_node)
     workflow.add_node("reedit_image", reedit_image_node)
 
     # Define the flow
-    workflow.set_entry_point("analyze_image")
+    workflow.set_entry_point("prepare_images")
+    workflow.add_edge("prepare_images", "analyze_image")
     workflow.add_edge("analyze_image", "improve_prompt")
     workflow.add_edge("improve_prompt", "reedit_image")
     workflow.add_edge("reedit_image", END)
 
     # Compile the graph
-    app = workflow.compile()
\ No newline at end of file
+    app = workflow.compile()
+    return app
+
+
+async def run_many(states: list[schema.ImageEditState], concurrency: int = 8, agent=None) -> list[dict]:
+    """Run a compiled agent over many initial states concurrently.
+
+    Defaults to the stage 1 agent; pass a compiled stage 2 agent to run that instead.
+    Image downloads share one HTTP client per event loop; await services.aclose_async_client()
+    before the loop ends to release its connections.
+    """
+    if agent is None:
+        agent = create_stage1_agent()
+    return await agent.abatch(states, config={"max_concurrency": concurrency, "recursion_limit": 25})
@@ -2,9 +2,9 @@
 Pydantic schemas for furniture scene generator.
 """
 
-from typing import Optional, TypedDict
+from typing import Annotated, Optional, TypedDict
 
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
 from decimal import Decimal
 
 from langchain_core.messages import HumanMessage, AIMessage
@@ -79,10 +79,11 @@ class ProductData(BaseModel):
         description="Edited Image"
     )
 
-    class Config:
-        """Pydantic model configuration."""
-        populate_by_name = True
-        json_schema_extra = {
+    model_config = ConfigDict(
+        populate_by_name=True,
+        frozen=True,
+        extra="ignore",
+        json_schema_extra={
             "example": {
                 "model": "SOF-12345",
                 "qoh": 15,
@@ -95,7 +96,17 @@ class ProductData(BaseModel):
                 "website_link_for_context": "https://example.com/products/sof-12345",
                 "lifestyle_image": "https://example.com/images/sof-12345-lifestyle.jpg"
             }
-        }
+        },
+    )
+
+
+def merge_errors(left: Optional[str], right: Optional[str]) -> Optional[str]:
+    """Reducer for ``ImageEditState.error`` so parallel branches can both report failures."""
+    if not left:
+        return right
+    if not right:
+        return left
+    return f"{left}; {right}"
 
 
 class ImageEditState(TypedDict):
@@ -103,8 +114,10 @@ class ImageEditState(TypedDict):
     improved_prompt: str
     product_data: ProductData
     response: Optional[AIMessage]
-    error: Optional[str]
+    error: Annotated[Optional[str], merge_errors]
     source_image_data: Optional[bytes]
     source_image_mime_type: Optional[str]
     target_width: Optional[int]
     target_height: Optional[int]
+    silo_message: Optional[dict]
+    lifestyle_message: Optional[dict]
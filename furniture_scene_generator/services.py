@@ -1,14 +1,35 @@
 import os
+import sys
+import asyncio
+import atexit
+import functools
+import hashlib
+import itertools
+import json
+import queue
+import random
+import shutil
+import zlib
 from io import BytesIO
 import requests
 import mimetypes
 import base64
 import logging
+import logging.handlers
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from decimal import Decimal
+from typing import Optional
 
+import asyncssh
+import cv2
+import diskcache
+import httpx
+import numpy as np
 import pandas as pd
 from PIL import Image
-import pysftp
 from google.cloud import vision
 from vertexai.preview.vision_models import ImageGenerationModel
 import vertexai
@@ -18,6 +39,49 @@ from furniture_scene_generator import config, schema
 
 logger = logging.getLogger(__name__)
 
+# Downloaded (image bytes, MIME type) keyed by URL, shared by every caller in the process.
+# Bounded by the total size of the cached images, least recently used first out.
+_IMAGE_CACHE_MAX_BYTES = config.IMAGE_MEMORY_CACHE_MB * 1024 * 1024
+_IMAGE_CACHE: "OrderedDict[str, tuple[bytes, Optional[str]]]" = OrderedDict()
+_IMAGE_CACHE_BYTES = 0
+_IMAGE_CACHE_LOCK = threading.Lock()
+
+# On-disk cache shared across runs, see get_image_disk_cache()
+_IMAGE_DISK_CACHE: Optional[diskcache.Cache] = None
+
+# Shared sync HTTP session so downloads reuse kept-alive connections
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32))
+_HTTP_SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32))
+
+# Shared async HTTP client per event loop so concurrent image fetches reuse pooled connections
+# (an httpx.AsyncClient is bound to the loop it first ran on)
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level=logging.INFO):
+    """Send package log records through a queue so formatting and console writes happen on a background thread"""
+    global _log_listener
+    if _log_listener is not None:
+        return _log_listener
+
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    _log_listener = logging.handlers.QueueListener(log_queue, console)
+
+    package_logger = logging.getLogger("furniture_scene_generator")
+    package_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    package_logger.setLevel(level)
+    package_logger.propagate = False
+
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    return _log_listener
+
 
 def initialize_google_clients():
     """Initialize Google Cloud clients"""
@@ -35,100 +99,309 @@ def initialize_google_clients():
     return vision_client, imagen_model
 
 
+def clear_image_cache():
+    """Drop all in-process cached image downloads and data URLs (the on-disk cache is kept)"""
+    global _IMAGE_CACHE_BYTES
+    with _IMAGE_CACHE_LOCK:
+        _IMAGE_CACHE.clear()
+        _IMAGE_CACHE_BYTES = 0
+    _image_data_url.cache_clear()
+
+
+def _image_cache_get(url: str) -> Optional[tuple[bytes, Optional[str]]]:
+    with _IMAGE_CACHE_LOCK:
+        entry = _IMAGE_CACHE.get(url)
+        if entry is not None:
+            _IMAGE_CACHE.move_to_end(url)
+        return entry
+
+
+def _image_cache_put(url: str, image_bytes: bytes, mime_type: Optional[str]):
+    global _IMAGE_CACHE_BYTES
+    if len(image_bytes) > _IMAGE_CACHE_MAX_BYTES:
+        return
+    with _IMAGE_CACHE_LOCK:
+        previous = _IMAGE_CACHE.pop(url, None)
+        if previous is not None:
+            _IMAGE_CACHE_BYTES -= len(previous[0])
+        _IMAGE_CACHE[url] = (image_bytes, mime_type)
+        _IMAGE_CACHE_BYTES += len(image_bytes)
+        while _IMAGE_CACHE_BYTES > _IMAGE_CACHE_MAX_BYTES:
+            _, (evicted, _) = _IMAGE_CACHE.popitem(last=False)
+            _IMAGE_CACHE_BYTES -= len(evicted)
+
+
+def _image_mime_type(url: str, content_type: Optional[str]) -> Optional[str]:
+    """Prefer the server's image/* Content-Type, falling back to a guess from the URL"""
+    content_type = (content_type or '').split(';')[0].strip()
+    if content_type.startswith('image/'):
+        return content_type
+    mime_type, _ = mimetypes.guess_type(url)
+    return mime_type
+
+
+def stream_url(url: str, fileobj, chunk_size=1 << 20) -> Optional[str]:
+    """Stream the body of url into fileobj in chunks over the shared HTTP session; returns the Content-Type"""
+    with _HTTP_SESSION.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, fileobj, length=chunk_size)
+        return response.headers.get('content-type')
+
+
+def fetch_image(url: str) -> tuple[bytes, Optional[str]]:
+    """Download image bytes and MIME type from URL, reusing earlier downloads of the same URL"""
+    entry = _image_cache_get(url)
+    if entry is None:
+        buf = BytesIO()
+        content_type = stream_url(url, buf)
+        entry = (buf.getvalue(), _image_mime_type(url, content_type))
+        _image_cache_put(url, *entry)
+    return entry
+
+
+def fetch_image_bytes(url: str) -> bytes:
+    """Download image bytes from URL, reusing earlier downloads of the same URL"""
+    return fetch_image(url)[0]
+
+
+def get_image_disk_cache() -> diskcache.Cache:
+    """On-disk cache of image data URLs and Vision analyses, shared across runs"""
+    global _IMAGE_DISK_CACHE
+    if _IMAGE_DISK_CACHE is None:
+        with _IMAGE_CACHE_LOCK:
+            if _IMAGE_DISK_CACHE is None:
+                _IMAGE_DISK_CACHE = diskcache.Cache(config.IMAGE_CACHE_DIR)
+    return _IMAGE_DISK_CACHE
+
+
+def _image_disk_cache_key(kind: str, *parts: str) -> str:
+    # The project version is part of the key so preprocessing/analysis changes invalidate old entries
+    return "|".join((kind, config.PROJECT_VERSION) + parts)
+
+
+def preprocess_image_bytes(raw: bytes, max_dim=1024, quality=85) -> bytes:
+    """Shrink an image to fit within max_dim on its long edge and re-encode it as JPEG"""
+    with Image.open(BytesIO(raw)) as img:
+        img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+
+        # Flatten any transparency onto white, since JPEG has no alpha channel
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        output = BytesIO()
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+
 def download_image(url):
-    """Download an image from URL"""
+    """Download an image from URL, downscaled for analysis"""
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        return response.content
+        return preprocess_image_bytes(fetch_image_bytes(url))
     except Exception as e:
         raise Exception(f"Failed to download image: {str(e)}")
 
 
+@functools.lru_cache(maxsize=1)
+def _vision_features():
+    """Vision API features requested for every product image (config.VISION_FEATURES)
+
+    Built on first use, so a misspelt feature name fails the analysis with a clear
+    message instead of breaking the import.
+    """
+    features = []
+    for name in config.VISION_FEATURES:
+        try:
+            feature_type = vision.Feature.Type[name]
+        except KeyError:
+            valid = ", ".join(t.name for t in vision.Feature.Type if t.name != 'TYPE_UNSPECIFIED')
+            raise ValueError(f"Unknown Vision feature {name!r} in VISION_FEATURES (expected one of: {valid})") from None
+        if feature_type == vision.Feature.Type.LABEL_DETECTION:
+            features.append(vision.Feature(
+                type_=feature_type, max_results=config.VISION_LABEL_MAX_RESULTS))
+        else:
+            features.append(vision.Feature(type_=feature_type))
+    return features
+
+
+# Maximum number of images the Vision API accepts in one BatchAnnotateImages call
+VISION_BATCH_SIZE = 16
+
+
 def analyze_product_image(vision_client, image_url, website_url=''):
     """Analyze product image to determine furniture type, style, and characteristics"""
     print(f"  → Analyzing image from URL...")
 
     try:
+        features = _vision_features()
+
         # Download the image
         image_content = download_image(image_url)
 
+        # Reuse the analysis of identical image content from an earlier run
+        cache = get_image_disk_cache()
+        cache_key = _image_disk_cache_key(
+            "analysis", hashlib.sha1(image_content).hexdigest(), website_url or '',
+            ",".join(config.VISION_FEATURES), str(config.VISION_LABEL_MAX_RESULTS))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"  ✓ Using cached analysis")
+            return json.loads(cached)
+
         # Prepare image for Vision API
         image = vision.Image(content=image_content)
 
         # Perform analysis
-        features = [
-            vision.Feature(
-                type_=vision.Feature.Type.LABEL_DETECTION, max_results=15),
-            vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES),
-            vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION),
-            vision.Feature(type_=vision.Feature.Type.WEB_DETECTION)
-        ]
-
         request = vision.AnnotateImageRequest(image=image, features=features)
         response = vision_client.annotate_image(request=request)
 
-        # Extract analysis results
-        labels = [label.description.lower()
-                  for label in response.label_annotations]
-        objects = [obj.name.lower()
-                   for obj in response.localized_object_annotations]
-        web_entities = [entity.description.lower(
-        ) for entity in response.web_detection.web_entities if entity.description]
-
-        # Extract hints from website URL
-        url_hints = []
-        if website_url:
-            url_hints = website_url.lower().replace('-', ' ').replace('/', ' ').split()
-
-        all_hints = labels + objects + web_entities + url_hints
-
-        # Determine furniture type
-        furniture_type, sub_type = detect_furniture_type(all_hints)
-
-        # Determine style
-        style = detect_style(all_hints)
-
-        # Determine material
-        material = detect_material(all_hints)
-
-        # Get dominant color
-        color_desc = 'medium wood'
-        if response.image_properties_annotation.dominant_colors.colors:
-            color = response.image_properties_annotation.dominant_colors.colors[0].color
-            color_desc = determine_color_description(
-                color.red, color.green, color.blue)
-
-        print(
-            f"  ✓ Detected: {furniture_type}{' (' + sub_type + ')' if sub_type else ''}, Style: {style}, Color: {color_desc}")
-
-        return {
-            'furniture_type': furniture_type,
-            'sub_type': sub_type,
-            'style': style,
-            'material': material,
-            'color_desc': color_desc,
-            'labels': labels
-        }
+        analysis = _analysis_from_response(response, website_url)
+        cache.set(cache_key, json.dumps(analysis), expire=config.IMAGE_CACHE_EXPIRE)
+        return analysis
 
     except Exception as e:
         print(f"  ✗ Error analyzing image: {str(e)}")
         raise
 
 
-def detect_furniture_type(hints):
-    """Detect furniture type from hints"""
+def analyze_product_images_batch(vision_client, image_contents, website_urls):
+    """Analyze many product images with batched Vision API calls.
+
+    Returns one analysis dict per image, in input order, or None where the
+    Vision API reported an error for that image.
+    """
+    features = _vision_features()
+    analyses = []
+    for start in range(0, len(image_contents), VISION_BATCH_SIZE):
+        chunk = image_contents[start:start + VISION_BATCH_SIZE]
+        print(f"  → Analyzing images {start + 1}-{start + len(chunk)} of {len(image_contents)}...")
+
+        batch_requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=features)
+            for content in chunk
+        ]
+        batch_response = vision_client.batch_annotate_images(requests=batch_requests)
+
+        for offset, response in enumerate(batch_response.responses):
+            if response.error.message:
+                print(f"  ✗ Error analyzing image {start + offset + 1}: {response.error.message}")
+                analyses.append(None)
+                continue
+            analyses.append(_analysis_from_response(response, website_urls[start + offset] or ''))
+
+    return analyses
+
+
+def _analysis_from_response(response, website_url=''):
+    """Derive furniture type, style, material and color from one Vision API response"""
+    # Extract analysis results
+    labels = [label.description.lower()
+              for label in response.label_annotations]
+    objects = [obj.name.lower()
+               for obj in response.localized_object_annotations]
+    # Empty unless WEB_DETECTION is enabled in config.VISION_FEATURES
+    web_entities = [entity.description.lower(
+    ) for entity in response.web_detection.web_entities if entity.description]
+
+    # Extract hints from website URL
+    url_hints = []
+    if website_url:
+        url_hints = website_url.lower().replace('-', ' ').replace('/', ' ').split()
+
+    hints_set = frozenset(labels + objects + web_entities + url_hints)
+
+    # Determine furniture type
+    furniture_type, sub_type = detect_furniture_type(hints_set, hint_flags(hints_set))
+
+    # Determine style
+    style = detect_style(hints_set)
+
+    # Determine material
+    material = detect_material(hints_set)
+
+    # Get dominant color
+    color_desc = determine_color_description(
+        response.image_properties_annotation.dominant_colors.colors)
+
+    print(
+        f"  ✓ Detected: {furniture_type}{' (' + sub_type + ')' if sub_type else ''}, Style: {style}, Color: {color_desc}")
+
+    return {
+        'furniture_type': furniture_type,
+        'sub_type': sub_type,
+        'style': style,
+        'material': material,
+        'color_desc': color_desc,
+        'labels': labels
+    }
+
+
+# Keyword sets matched against the hints with a single set intersection
+_GRANDFATHER = frozenset({'grandfather', 'floor'})
+_MANTEL = frozenset({'mantel', 'mantle'})
+_BOOKCASE = frozenset({'bookcase', 'bookshelf'})
+_MODERN = frozenset({'modern', 'contemporary'})
+_RUSTIC = frozenset({'rustic', 'farmhouse'})
+_VINTAGE = frozenset({'vintage', 'antique'})
+_ELEGANT = frozenset({'elegant', 'formal'})
+_WOOD = frozenset({'wood', 'wooden'})
+
+# Words looked up inside multi-word hints (e.g. 'wine bar cabinet')
+_SUBSTRING_KEYWORDS = ('clock', 'wine', 'bar', 'cabinet', 'rack', 'cart', 'display')
+
+# Bits of hint_flags() for the substring checks, which plain set lookups can't express
+HAS_CLOCK = 1
+HAS_WINE_CABINET = 2
+HAS_BAR_CABINET = 4
+HAS_DISPLAY_CABINET = 8
+
+
+def _substring_index(hints):
+    """Map each substring keyword to the hints containing it, in one pass over the hints"""
+    index = {keyword: set() for keyword in _SUBSTRING_KEYWORDS}
+    for h in hints:
+        for keyword in _SUBSTRING_KEYWORDS:
+            if keyword in h:
+                index[keyword].add(h)
+    return index
+
+
+def hint_flags(hints):
+    """Compute the HAS_* substring flags for a set of hints"""
+    found = _substring_index(hints)
+    flags = 0
+    if found['clock']:
+        flags |= HAS_CLOCK
+    if found['wine'] & (found['bar'] | found['cabinet'] | found['rack']):
+        flags |= HAS_WINE_CABINET
+    if found['bar'] & (found['cabinet'] | found['cart']):
+        flags |= HAS_BAR_CABINET
+    if found['display'] & found['cabinet']:
+        flags |= HAS_DISPLAY_CABINET
+    return flags
+
+
+@functools.lru_cache(maxsize=4096)
+def detect_furniture_type(hints: frozenset, flags: Optional[int] = None) -> tuple[str, str]:
+    """Detect furniture type from a frozenset of hints and their hint_flags()"""
+    if flags is None:
+        flags = hint_flags(hints)
     furniture_type = 'furniture piece'
     sub_type = ''
 
     # Check for clocks
-    if any('clock' in h for h in hints):
-        if any(h in hints for h in ['grandfather', 'floor']):
+    if flags & HAS_CLOCK:
+        if hints & _GRANDFATHER:
             furniture_type = 'grandfather clock'
             sub_type = 'floor clock'
         elif 'wall' in hints:
             furniture_type = 'wall clock'
-        elif any(h in hints for h in ['mantel', 'mantle']):
+        elif hints & _MANTEL:
             furniture_type = 'mantel clock'
         elif 'table' in hints:
             furniture_type = 'table clock'
@@ -141,10 +414,10 @@ def detect_furniture_type(hints):
         sub_type = 'display cabinet'
 
     # Check for wine/bar cabinets
-    elif any('wine' in h and any(x in h for x in ['bar', 'cabinet', 'rack']) for h in hints):
+    elif flags & HAS_WINE_CABINET:
         furniture_type = 'wine cabinet'
         sub_type = 'wine bar'
-    elif any('bar' in h and ('cabinet' in h or 'cart' in h) for h in hints):
+    elif flags & HAS_BAR_CABINET:
         furniture_type = 'bar cabinet'
         if 'cart' in hints:
             sub_type = 'bar cart'
@@ -152,13 +425,13 @@ def detect_furniture_type(hints):
     # Check for other cabinet types
     elif 'console' in hints:
         furniture_type = 'console cabinet'
-    elif any('display' in h and 'cabinet' in h for h in hints):
+    elif flags & HAS_DISPLAY_CABINET:
         furniture_type = 'display cabinet'
     elif 'cabinet' in hints:
         furniture_type = 'cabinet'
 
     # Check for other furniture
-    elif any(h in hints for h in ['bookcase', 'bookshelf']):
+    elif hints & _BOOKCASE:
         furniture_type = 'bookcase'
     elif 'chest' in hints:
         furniture_type = 'chest'
@@ -166,28 +439,28 @@ def detect_furniture_type(hints):
     return furniture_type, sub_type
 
 
-def detect_style(hints):
-    """Detect style from hints"""
-    if any(h in hints for h in ['modern', 'contemporary']):
+@functools.lru_cache(maxsize=4096)
+def detect_style(hints: frozenset) -> str:
+    """Detect style from a frozenset of hints"""
+    if hints & _MODERN:
         return 'modern'
-    elif any(h in hints for h in ['rustic', 'farmhouse']):
+    elif hints & _RUSTIC:
         return 'rustic'
     elif 'industrial' in hints:
         return 'industrial'
     elif 'transitional' in hints:
         return 'transitional'
-    elif any(h in hints for h in ['vintage', 'antique']):
+    elif hints & _VINTAGE:
         return 'vintage'
-    elif any(h in hints for h in ['elegant', 'formal']):
+    elif hints & _ELEGANT:
         return 'elegant traditional'
-    elif any(h in hints for h in ['traditional', 'classic']):
-        return 'traditional'
     else:
         return 'traditional'
 
 
-def detect_material(hints):
-    """Detect material from hints"""
+@functools.lru_cache(maxsize=4096)
+def detect_material(hints: frozenset) -> str:
+    """Detect material from a frozenset of hints"""
     if 'cherry' in hints:
         return 'cherry wood'
     elif 'oak' in hints:
@@ -196,7 +469,7 @@ def detect_material(hints):
         return 'mahogany wood'
     elif 'walnut' in hints:
         return 'walnut wood'
-    elif any(h in hints for h in ['wood', 'wooden']):
+    elif hints & _WOOD:
         return 'wood'
     elif 'metal' in hints:
         return 'metal and wood'
@@ -206,35 +479,61 @@ def detect_material(hints):
         return 'wood'
 
 
-def determine_color_description(r, g, b):
-    """Determine color description from RGB values"""
-    if r < 50 and g < 50 and b < 50:
+# Channel boundaries for quantizing a color to 3 levels (0 = dark, 1 = mid, 2 = bright)
+_COLOR_BINS = np.array([85, 170], dtype=np.float32)
+# Bright, nearly grey colors are treated as the studio background of a silo image
+_BACKGROUND_MIN_BRIGHTNESS = 200
+_BACKGROUND_MAX_SATURATION = 0.1
+
+
+def _color_name(levels):
+    r, g, b = levels
+    if levels == (0, 0, 0):
         return 'dark'
-    elif r > 200 and g > 200 and b > 200:
+    elif levels == (2, 2, 2):
         return 'light'
-    elif r > 150 and g < 100 and b < 100:
+    elif levels == (2, 0, 0):
         return 'warm wood'
-    elif r > 100 and g > 80 and b < 70:
+    elif r >= 1 and g >= 1 and b == 0:
         return 'rich wood'
     else:
         return 'medium wood'
 
 
-def generate_room_scene_prompt(wl_model, analysis):
-    """Generate a detailed prompt for room scene creation"""
-    furniture_type = analysis['furniture_type']
-    sub_type = analysis['sub_type']
-    style = analysis['style']
-    material = analysis['material']
-    color_desc = analysis['color_desc']
+# Quantized (r, g, b) levels -> color description
+_COLOR_TABLE = {levels: _color_name(levels)
+                for levels in itertools.product(range(3), repeat=3)}
 
-    # Determine room context based on furniture type
-    room_type, room_desc, placement, context = get_room_context(furniture_type)
 
-    # Create detailed prompt
-    prompt = f"""Create a photorealistic, high-end interior design photograph featuring a {color_desc} {material} {furniture_type}{' / ' + sub_type if sub_type else ''} in a {room_desc}. 
+def determine_color_description(colors):
+    """Determine color description from Vision dominant colors, weighted by pixel fraction"""
+    if not colors:
+        return 'medium wood'
 
-THE {furniture_type.upper()} MUST BE:
+    rgb = np.array([[c.color.red, c.color.green, c.color.blue]
+                   for c in colors], dtype=np.float32)
+    weights = np.array([c.pixel_fraction for c in colors], dtype=np.float32)
+
+    # Drop the background so it doesn't wash the product color out to 'light';
+    # if everything looks like background (a white product), keep it all
+    brightness = rgb.max(axis=1)
+    saturation = (brightness - rgb.min(axis=1)) / np.maximum(brightness, 1)
+    product = ~((brightness >= _BACKGROUND_MIN_BRIGHTNESS) & (saturation <= _BACKGROUND_MAX_SATURATION))
+    if product.any():
+        rgb, weights = rgb[product], weights[product]
+
+    if weights.sum() <= 0:
+        weights = np.ones(len(rgb), dtype=np.float32)
+
+    mean = (rgb * weights[:, None]).sum(axis=0) / weights.sum()
+    levels = np.digitize(mean, _COLOR_BINS)
+    return _COLOR_TABLE[tuple(int(level) for level in levels)]
+
+
+# Room scene prompt, filled in per product by generate_room_scene_prompt
+_PROMPT_TEMPLATE = """Create a photorealistic, high-end interior design photograph featuring a {color_desc} {material} {furniture_type}{sub_type_suffix} in a {room_desc}. 
+
+THE {furniture_type_upper} MUST BE:
 - The absolute focal point and hero of the image
 - {placement}
 - Fully visible from a flattering 3/4 front angle with no obstructions
@@ -243,7 +542,7 @@ THE {furniture_type.upper()} MUST BE:
 - Taking up significant visual space in the composition (prominent but not cropped)
 
 ROOM STYLING:
-- {style.capitalize()} interior design aesthetic
+- {style_title} interior design aesthetic
 - {context}
 - Multiple light sources: natural window light, subtle accent lighting, warm ambient fixtures
 - Professional styling with attention to balance and negative space
@@ -259,75 +558,142 @@ PHOTOGRAPHY QUALITY:
 
 COLOR PALETTE: Rich, harmonious colors that complement the {color_desc} tones of the {furniture_type}, creating an aspirational yet attainable space that makes the furniture piece irresistible."""
 
+
+def generate_room_scene_prompt(wl_model, analysis):
+    """Generate a detailed prompt for room scene creation"""
+    furniture_type = analysis['furniture_type']
+    sub_type = analysis['sub_type']
+    style = analysis['style']
+
+    # Determine room context based on furniture type
+    room_type, room_desc, placement, context = get_room_context(furniture_type)
+
+    # Create detailed prompt
+    prompt = _PROMPT_TEMPLATE.format_map({
+        'color_desc': analysis['color_desc'],
+        'material': analysis['material'],
+        'furniture_type': furniture_type,
+        'furniture_type_upper': furniture_type.upper(),
+        'sub_type_suffix': ' / ' + sub_type if sub_type else '',
+        'style_title': style.capitalize(),
+        'room_desc': room_desc,
+        'placement': placement,
+        'context': context,
+    })
+
     print(f"  → Generated prompt for {style} {room_type} scene")
     return prompt
 
 
-def get_room_context(furniture_type):
-    """Get appropriate room context for furniture type"""
-    import random
-
+# Candidate (room_type, room_desc, placement, context) settings per furniture category
+ROOM_CONTEXTS: dict[str, tuple[tuple[str, str, str, str], ...]] = {
+    'wine_bar': (
+        ('dining room', 'sophisticated dining room with elegant table setting visible in background',
+         'positioned along the wall as a statement piece',
+         'fine dining table with chairs, elegant chandelier overhead'),
+        ('living room', 'upscale living room with comfortable seating area',
+         'featured prominently near the seating area',
+         'plush sofa, armchairs, coffee table with books'),
+        ('home entertainment area', 'dedicated home bar or entertainment space',
+         'as the centerpiece of the entertainment area',
+         'bar stools, ambient lighting, tasteful wall art'),
+    ),
+    'display': (
+        ('living room', 'elegant living room with refined furnishings',
+         'displayed prominently as a focal point',
+         'comfortable seating, side tables, decorative accessories visible inside the cabinet'),
+        ('dining room', 'formal dining room with sophisticated ambiance',
+         'featured elegantly against the wall',
+         'dining table in background, fine china or collectibles visible inside the cabinet'),
+        ('entryway or foyer', 'grand entryway with welcoming atmosphere',
+         'showcased as a statement piece',
+         'elegant mirror, console table, decorative items displayed inside the cabinet'),
+    ),
+    'floor_clock': (
+        ('living room', 'classic living room with timeless elegance',
+         'standing majestically as a centerpiece',
+         'traditional furniture, area rug, the clock commanding attention'),
+        ('entryway or foyer', 'grand entryway with welcoming presence',
+         'positioned impressively to greet visitors',
+         'elegant console table, mirror, the clock as a statement piece'),
+        ('home library or study', 'distinguished library or study with rich character',
+         'standing prominently in a corner or along the wall',
+         'bookshelves, leather furniture, warm wood tones'),
+    ),
+    'wall_clock': (
+        ('living room or dining room', 'well-appointed room with classic style',
+         'mounted prominently on the wall at eye level',
+         'complementary furniture below, balanced room composition'),
+    ),
+    'mantel_clock': (
+        ('living room', 'cozy living room with fireplace',
+         'displayed elegantly on the fireplace mantel',
+         'comfortable seating, fireplace, the clock as a mantel centerpiece'),
+    ),
+    'clock': (
+        ('living room or study', 'refined interior space',
+         'positioned prominently on a side table or shelf',
+         'tasteful furniture, the clock clearly visible'),
+    ),
+    'default': (
+        ('living room or dining room', 'beautifully appointed room with elegant furnishings',
+         'positioned prominently as a featured piece',
+         'complementary furniture and sophisticated decor'),
+    ),
+}
+
+
+def _classify(furniture_type):
+    """Map a detected furniture type to its ROOM_CONTEXTS key"""
     if 'wine' in furniture_type or 'bar' in furniture_type:
-        options = [
-            ('dining room', 'sophisticated dining room with elegant table setting visible in background',
-             'positioned along the wall as a statement piece',
-             'fine dining table with chairs, elegant chandelier overhead'),
-            ('living room', 'upscale living room with comfortable seating area',
-             'featured prominently near the seating area',
-             'plush sofa, armchairs, coffee table with books'),
-            ('home entertainment area', 'dedicated home bar or entertainment space',
-             'as the centerpiece of the entertainment area',
-             'bar stools, ambient lighting, tasteful wall art')
-        ]
-        return random.choice(options)
-
+        return 'wine_bar'
     elif 'curio' in furniture_type or 'display' in furniture_type:
-        options = [
-            ('living room', 'elegant living room with refined furnishings',
-             'displayed prominently as a focal point',
-             'comfortable seating, side tables, decorative accessories visible inside the cabinet'),
-            ('dining room', 'formal dining room with sophisticated ambiance',
-             'featured elegantly against the wall',
-             'dining table in background, fine china or collectibles visible inside the cabinet'),
-            ('entryway or foyer', 'grand entryway with welcoming atmosphere',
-             'showcased as a statement piece',
-             'elegant mirror, console table, decorative items displayed inside the cabinet')
-        ]
-        return random.choice(options)
-
+        return 'display'
     elif 'grandfather' in furniture_type or 'floor' in furniture_type:
-        options = [
-            ('living room', 'classic living room with timeless elegance',
-             'standing majestically as a centerpiece',
-             'traditional furniture, area rug, the clock commanding attention'),
-            ('entryway or foyer', 'grand entryway with welcoming presence',
-             'positioned impressively to greet visitors',
-             'elegant console table, mirror, the clock as a statement piece'),
-            ('home library or study', 'distinguished library or study with rich character',
-             'standing prominently in a corner or along the wall',
-             'bookshelves, leather furniture, warm wood tones')
-        ]
-        return random.choice(options)
-
+        return 'floor_clock'
     elif 'wall' in furniture_type and 'clock' in furniture_type:
-        return ('living room or dining room', 'well-appointed room with classic style',
-                'mounted prominently on the wall at eye level',
-                'complementary furniture below, balanced room composition')
-
+        return 'wall_clock'
     elif 'mantel' in furniture_type:
-        return ('living room', 'cozy living room with fireplace',
-                'displayed elegantly on the fireplace mantel',
-                'comfortable seating, fireplace, the clock as a mantel centerpiece')
-
+        return 'mantel_clock'
     elif 'clock' in furniture_type:
-        return ('living room or study', 'refined interior space',
-                'positioned prominently on a side table or shelf',
-                'tasteful furniture, the clock clearly visible')
-
+        return 'clock'
     else:
-        return ('living room or dining room', 'beautifully appointed room with elegant furnishings',
-                'positioned prominently as a featured piece',
-                'complementary furniture and sophisticated decor')
+        return 'default'
+
+
+# Module-level generator for room context picks
+_rng = random.Random()
+
+
+def get_room_context(furniture_type):
+    """Get appropriate room context for furniture type
+
+    With config.DETERMINISTIC_ROOM_CONTEXT the same furniture type always gets the same context,
+    so prompts (and anything cached on them) stay stable across runs.
+    """
+    options = ROOM_CONTEXTS[_classify(furniture_type)]
+    if config.DETERMINISTIC_ROOM_CONTEXT:
+        # crc32 rather than hash(), which is salted differently in every process
+        return options[zlib.crc32(furniture_type.encode()) % len(options)]
+    return _rng.choice(options)
+
+
+# Encoder settings for the generated room scenes written to disk and uploaded
+OUTPUT_JPEG_OPTIONS = {"quality": 92, "optimize": True, "progressive": True}
+
+
+def to_output_jpeg(image_bytes: bytes) -> bytes:
+    """Re-encode a generated image as an OUTPUT_JPEG_OPTIONS JPEG"""
+    with Image.open(BytesIO(image_bytes)) as img:
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.split()[-1])
+        else:
+            img = img.convert("RGB")
+        buf = BytesIO()
+        img.save(buf, format="JPEG", **OUTPUT_JPEG_OPTIONS)
+    return buf.getvalue()
 
 
 def generate_room_scene(imagen_model, prompt, output_path):
@@ -347,9 +713,10 @@ def generate_room_scene(imagen_model, prompt, output_path):
         if not response or not response.images:
             raise Exception("No images generated by Imagen API")
 
-        # Save the image
+        # Save the image (JPEG is far cheaper to encode and upload than PNG)
         image = response.images[0]
-        image._pil_image.save(output_path)
+        image._pil_image.convert("RGB").save(
+            output_path, format="JPEG", **OUTPUT_JPEG_OPTIONS)
 
         print(f"  ✓ Image saved to: {output_path}")
         return output_path
@@ -359,34 +726,138 @@ def generate_room_scene(imagen_model, prompt, output_path):
         raise
 
 
-def upload_to_sftp(local_path, remote_filename):
-    """Upload image to SFTP server"""
+# Ciphers offered to the SFTP server, fastest first (AES-GCM uses AES-NI, ChaCha20 is fast without it)
+_SFTP_ENCRYPTION_ALGS = (
+    'aes128-gcm@openssh.com',
+    'aes256-gcm@openssh.com',
+    'chacha20-poly1305@openssh.com',
+    'aes128-ctr',
+    'aes256-ctr',
+)
+
+
+def _sftp_connect(keepalive_interval=30):
+    return asyncssh.connect(
+        config.SFTP_HOST,
+        port=config.SFTP_PORT,
+        username=config.SFTP_USERNAME,
+        password=config.SFTP_PASSWORD,
+        known_hosts=None,  # Disable host key checking (use with caution)
+        encryption_algs=_SFTP_ENCRYPTION_ALGS,
+        keepalive_interval=keepalive_interval,
+    )
+
+
+async def _sftp_put(sftp, local_path, remote_path):
+    if hasattr(local_path, 'read'):
+        local_path.seek(0)
+        async with sftp.open(remote_path, 'wb') as remote_file:
+            await remote_file.write(local_path.read())
+    else:
+        await sftp.put(local_path, remote_path)
+
+
+async def aupload_to_sftp(local_path, remote_filename, sftp=None):
+    """Upload image to SFTP server
+
+    local_path is a file path, or a file-like object (e.g. BytesIO) whose contents are written directly.
+    Uses the given open asyncssh SFTP client (e.g. from SftpPool.connection()), or opens a one-off connection.
+    """
     print(f"  → Uploading to SFTP server...")
 
-    cnopts = pysftp.CnOpts()
-    cnopts.hostkeys = None  # Disable host key checking (use with caution)
+    remote_path = os.path.join(
+        config.SFTP_REMOTE_PATH, remote_filename).replace('\\', '/')
 
     try:
-        with pysftp.Connection(
-            host=config.SFTP_HOST,
-            port=config.SFTP_PORT,
-            username=config.SFTP_USERNAME,
-            password=config.SFTP_PASSWORD,
-            cnopts=cnopts
-        ) as sftp:
-            remote_path = os.path.join(
-                config.SFTP_REMOTE_PATH, remote_filename).replace('\\', '/')
-            sftp.put(local_path, remote_path)
-
-            public_url = f"{config.SFTP_BASE_URL.rstrip('/')}/{remote_filename}"
-            print(f"  ✓ Uploaded successfully: {public_url}")
-            return public_url
+        if sftp is not None:
+            await _sftp_put(sftp, local_path, remote_path)
+        else:
+            async with _sftp_connect() as conn:
+                async with conn.start_sftp_client() as one_off_sftp:
+                    await _sftp_put(one_off_sftp, local_path, remote_path)
+
+        public_url = f"{config.SFTP_BASE_URL.rstrip('/')}/{remote_filename}"
+        print(f"  ✓ Uploaded successfully: {public_url}")
+        return public_url
 
     except Exception as e:
         print(f"  ✗ SFTP upload error: {str(e)}")
         raise
 
 
+def upload_to_sftp(local_path, remote_filename):
+    """Blocking wrapper around aupload_to_sftp for scripts without an event loop"""
+    return asyncio.run(aupload_to_sftp(local_path, remote_filename))
+
+
+class SftpPool:
+    """Keeps up to `size` SFTP sessions open so uploads skip the SSH handshake
+
+    Sessions are opened lazily and shared between tasks on one event loop:
+
+        async with SftpPool() as pool:
+            async with pool.connection() as sftp:
+                await aupload_to_sftp(local_path, remote_filename, sftp)
+    """
+
+    def __init__(self, size=None, keepalive=30):
+        self.size = size or config.SFTP_POOL_SIZE
+        self.keepalive = keepalive
+        # Every borrower holds a slot, so at most `size` sessions are ever open
+        self._slots = asyncio.Semaphore(self.size)
+        self._idle = asyncio.LifoQueue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _connect(self):
+        conn = await _sftp_connect(keepalive_interval=self.keepalive)
+        try:
+            return conn, await conn.start_sftp_client()
+        except Exception:
+            conn.close()
+            raise
+
+    async def _discard(self, session):
+        conn, sftp = session
+        sftp.exit()
+        conn.close()
+        try:
+            await conn.wait_closed()
+        except Exception:
+            pass
+
+    async def _acquire(self):
+        # Caller holds a slot: reuse an idle session if one is still alive, else open a new one
+        while not self._idle.empty():
+            session = await self._idle.get()
+            if not session[0].is_closed():
+                return session
+            await self._discard(session)
+        return await self._connect()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow an open SFTPClient; it goes back to the pool afterwards unless the link dropped"""
+        async with self._slots:
+            session = await self._acquire()
+            try:
+                yield session[1]
+            finally:
+                if session[0].is_closed():
+                    await self._discard(session)
+                else:
+                    self._idle.put_nowait(session)
+
+    async def close(self):
+        """Close every idle session"""
+        while not self._idle.empty():
+            await self._discard(self._idle.get_nowait())
+
+
 def create_place_image_in_room_prompt(room_type="living room", other_possible_furniture="sofa and chairs") -> str:
     return (
         "Analyze the attached photo of a piece of furniture to determine "
@@ -399,7 +870,27 @@ def create_place_image_in_room_prompt(room_type="living room", other_possible_fu
     )
 
 
+@functools.lru_cache(maxsize=1024)
+def _image_data_url(url: str) -> str:
+    """Download, shrink and base64-encode an image URL; raises on failure so errors are never cached"""
+    cache = get_image_disk_cache()
+    cache_key = _image_disk_cache_key("data_url", url)
+    data_url = cache.get(cache_key)
+    if data_url is None:
+        # Download the image and shrink it to a bounded JPEG
+        image_bytes = preprocess_image_bytes(fetch_image_bytes(url))
+
+        # Encode the image content as base64
+        encoded = base64.b64encode(image_bytes).decode("utf-8")
+
+        # Build data URL
+        data_url = f"data:image/jpeg;base64,{encoded}"
+        cache.set(cache_key, data_url, expire=config.IMAGE_CACHE_EXPIRE)
+    return data_url
+
+
 def url_to_data_url(url: str) -> str:
+    """Inline an image URL as a JPEG data URL, cached in-process and on disk (IMAGE_CACHE_DIR)"""
     # If it's already a data URL, return as-is
     if url.strip().lower().startswith("data:"):
         return url
@@ -409,16 +900,7 @@ def url_to_data_url(url: str) -> str:
 
     if mime_type and mime_type.startswith("image/"):
         try:
-            # Download the image
-            response = requests.get(url)
-            response.raise_for_status()
-
-            # Encode the image content as base64
-            encoded = base64.b64encode(response.content).decode("utf-8")
-
-            # Build data URL
-            data_url = f"data:{mime_type};base64,{encoded}"
-            return data_url
+            return _image_data_url(url)
         except Exception as e:
             # If anything goes wrong, fallback to original URL
             print(f"Error downloading/encoding image: {e}")
@@ -537,11 +1019,51 @@ def downscale_image(image_data: bytes, mime_type: str, width: int, height: int)
 
 
 def get_image_url_data(url: str) -> dict:
-    mime_type, _ = mimetypes.guess_type(url)
+    image_bytes, mime_type = fetch_image(url)
+    return {"image_data": image_bytes, "mime_type": mime_type}
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=30,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32))
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """Close the running event loop's shared HTTP client; call it before the loop finishes"""
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def get_image_url_data_async(url: str) -> dict:
+    """Async version of get_image_url_data using the shared pooled HTTP client"""
+    entry = _image_cache_get(url)
+    if entry is None:
+        response = await _get_async_client().get(url)
+        response.raise_for_status()
+        entry = (response.content, _image_mime_type(url, response.headers.get('content-type')))
+        _image_cache_put(url, *entry)
+
+    image_bytes, mime_type = entry
+    return {"image_data": image_bytes, "mime_type": mime_type}
+
 
-    response = requests.get(url)
-    response.raise_for_status()
-    return {"image_data": response.content, "mime_type": mime_type}
+def message_text(content) -> str:
+    """Return the text parts of a chat message's content, skipping inline image parts"""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+        if isinstance(part, str) or (isinstance(part, dict) and part.get("type") == "text"))
 
 
 def image_data_to_message(image_data: bytes, mime_type: str) -> dict:
@@ -553,54 +1075,123 @@ def image_data_to_message(image_data: bytes, mime_type: str) -> dict:
     }
 
 
-def read_excel_file():
-    # Read Excel file
-    logger.info(f"\n📂 Reading Excel file: {config.EXCEL_INPUT_PATH}")
-    # Ensure Model column is read as string
-    df = pd.read_excel(config.EXCEL_INPUT_PATH, dtype={"Model": str})
+# Money columns and QOH are read as text and converted once per column,
+# so rows never go through a float -> str -> Decimal round-trip
+MONEY_COLUMNS = ('Retail', 'MAP', 'Cost', 'Landed Cost')
+_EXCEL_DTYPES = {"Model": str, "QOH": str, **{column: str for column in MONEY_COLUMNS}}
+
+
+def _parse_cell(text, parse):
+    # Cells that don't parse keep their original text, so writing the sheet back
+    # doesn't lose them; product_from_values reports them per row
+    if pd.isna(text):
+        return None
+    try:
+        return parse(text.strip())
+    except (ArithmeticError, ValueError):
+        return text
+
+
+def _parse_qoh(text: str) -> int:
+    value = Decimal(text)
+    if value != value.to_integral_value():
+        raise ValueError(f"{text!r} is not a whole number")
+    return int(value)
+
+
+def _read_product_excel(path) -> pd.DataFrame:
+    logger.info(f"\n📂 Reading Excel file: {path}")
+    df = pd.read_excel(path, dtype=_EXCEL_DTYPES)
+    for column in MONEY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].map(lambda text: _parse_cell(text, Decimal)).astype(object)
+    if 'QOH' in df.columns:
+        df['QOH'] = df['QOH'].map(lambda text: _parse_cell(text, _parse_qoh)).astype(object)
     logger.info(f"✓ Found {len(df)} products")
     return df
 
 
+def read_excel_file():
+    # Read Excel file
+    return _read_product_excel(config.EXCEL_INPUT_PATH)
+
+
 def read_edit_excel_file():
     # Read Excel file
-    logger.info(f"\n📂 Reading Excel file: {config.EXCEL_EDITED_INPUT_PATH}")
-    # Ensure Model column is read as string
-    df = pd.read_excel(config.EXCEL_EDITED_INPUT_PATH, dtype={"Model": str})
-    logger.info(f"✓ Found {len(df)} products")
-    return df
+    return _read_product_excel(config.EXCEL_EDITED_INPUT_PATH)
+
+
+def _to_str(value) -> str:
+    return str(value)
+
+
+def _to_int(value) -> int:
+    if isinstance(value, str):
+        return _parse_qoh(value.strip())
+    return int(value)
+
+
+def _to_decimal(value) -> Decimal:
+    # read_excel_file already yields Decimals; other frames may still hold floats
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+# Spreadsheet column -> (ProductData field, converter); missing/NaN cells become None
+_PRODUCT_COLUMNS = (
+    ('Model', 'model', _to_str),
+    ('QOH', 'qoh', _to_int),
+    ('WL', 'wl', _to_str),
+    ('Retail', 'retail', _to_decimal),
+    ('MAP', 'map', _to_decimal),
+    ('Cost', 'cost', _to_decimal),
+    ('Landed Cost', 'landed_cost', _to_decimal),
+    ('Silo Image', 'silo_image', _to_str),
+    ('WebSite Link for Context', 'website_link_for_context', _to_str),
+    ('Lifestyle Image', 'lifestyle_image', _to_str),
+    ('comment', 'comment', _to_str),
+    ('Edited Image', 'edited_image', _to_str),
+)
+_PRODUCT_COLUMN_NAMES = [column for column, _, _ in _PRODUCT_COLUMNS]
+
+
+def product_from_values(values) -> schema.ProductData:
+    """Build a ProductData from cell values ordered like _PRODUCT_COLUMNS (None = empty cell)"""
+    fields = {}
+    for (column, field, convert), value in zip(_PRODUCT_COLUMNS, values):
+        if value is None:
+            fields[field] = None
+            continue
+        try:
+            fields[field] = convert(value)
+        except (ArithmeticError, ValueError, TypeError) as e:
+            # A malformed cell (e.g. "$1,299") blanks that field instead of aborting the run
+            logger.warning(f"  ⚠️ Ignoring invalid {column} value {value!r} for model {values[0]}: {e!r}")
+            fields[field] = None
+    if fields['model'] is None:
+        fields['model'] = ''
+    # Values are already converted to their field types here, so skip pydantic validation
+    return schema.ProductData.model_construct(**fields)
+
+
+def product_values(df: pd.DataFrame) -> list[tuple]:
+    """Cell values of every row, ordered like _PRODUCT_COLUMNS with NaN mapped to None
+
+    Extract these once per frame and pass each tuple to product_from_values,
+    instead of building a Series per row for row_to_product_data.
+    """
+    frame = df.reindex(columns=_PRODUCT_COLUMN_NAMES).astype(object)
+    frame = frame.where(pd.notna(frame), None)
+    return list(frame.itertuples(index=False, name=None))
 
 
 def row_to_product_data(row) -> schema.ProductData:
-    row_dict = row.to_dict()
-
-    # Create ProductData object from row
-    # Map DataFrame columns to schema fields
-    # Pydantic will handle type validation and conversion
-    product_data = schema.ProductData(
-        model=str(row_dict.get('Model', '')),
-        qoh=int(row_dict['QOH']) if pd.notna(row_dict.get('QOH')) else None,
-        wl=str(row_dict['WL']) if pd.notna(row_dict.get('WL')) else None,
-        retail=Decimal(str(row_dict['Retail'])) if pd.notna(
-            row_dict.get('Retail')) else None,
-        MAP=Decimal(str(row_dict['MAP'])) if pd.notna(
-            row_dict.get('MAP')) else None,
-        cost=Decimal(str(row_dict['Cost'])) if pd.notna(
-            row_dict.get('Cost')) else None,
-        landed_cost=Decimal(str(row_dict['Landed Cost'])) if pd.notna(
-            row_dict.get('Landed Cost')) else None,
-        silo_image=str(row_dict['Silo Image']) if pd.notna(
-            row_dict.get('Silo Image')) else None,
-        website_link_for_context=str(row_dict['WebSite Link for Context']) if pd.notna(
-            row_dict.get('WebSite Link for Context')) else None,
-        lifestyle_image=str(row_dict['Lifestyle Image']) if pd.notna(
-            row_dict.get('Lifestyle Image')) else None,
-        comment=str(row_dict['comment']) if pd.notna(
-            row_dict.get('comment')) else None,
-        edited_image=str(row_dict['Edited Image']) if pd.notna(
-            row_dict.get('Edited Image')) else None,
-    )
-    return product_data
+    values = []
+    for column in _PRODUCT_COLUMN_NAMES:
+        value = row.get(column)
+        values.append(value if pd.notna(value) else None)
+    return product_from_values(values)
 
 
 def read_product_data_from_df(df: pd.DataFrame) -> list[schema.ProductData]:
@@ -609,10 +1200,9 @@ def read_product_data_from_df(df: pd.DataFrame) -> list[schema.ProductData]:
 
     logger.info(f"\n🔄 Processing {len(df)} products...")
 
-    for idx, row in df.iterrows():
+    for idx, values in zip(df.index, product_values(df)):
         try:
-            # Convert row to dictionary and handle NaN values
-            product_data = row_to_product_data(row)
+            product_data = product_from_values(values)
             products.append(product_data)
             logger.debug(f"  ✓ Processed product: {product_data.model}")
 
@@ -624,8 +1214,8 @@ def read_product_data_from_df(df: pd.DataFrame) -> list[schema.ProductData]:
     return products
 
 
-def generate_room_scene_with_agent(agent, original_prompt, product_data, local_output_path):
-    initial_state = {
+def _agent_initial_state(original_prompt, product_data) -> dict:
+    return {
         "original_prompt": original_prompt,
         "improved_prompt": "",
         "product_data": product_data,
@@ -635,58 +1225,144 @@ def generate_room_scene_with_agent(agent, original_prompt, product_data, local_o
         "source_image_mime_type": None,
         "target_width": 1024,
         "target_height": 1024,
+        "silo_message": None,
+        "lifestyle_message": None,
     }
 
+
+def _agent_response_image_url(final_state) -> Optional[str]:
+    """Log the agent's response and return the URL of the first image part in it"""
+    test_response = final_state['response']
+    logger.info("✓ Model is working! Generated test response successfully")
+    logger.info(f"  Response type: {type(test_response)}")
+    logger.info(
+        f"  Content preview: {message_text(test_response.content)[:200] or '<non-text>'}...")
+
+    for resp in test_response.content:
+        if type(resp) == str:
+            print(resp)
+        elif type(resp) == dict:
+            if resp['type'] == 'image_url':
+                return resp['image_url']['url']
+        else:
+            logger.warning(f"Unknown response type: {type(resp)} : {resp}")
+    return None
+
+
+def _inline_image_bytes(image_url: str) -> Optional[bytes]:
+    """Decode a data: URL; returns None for remote URLs, which the caller downloads"""
+    if not image_url.startswith('data:'):
+        return None
+    header, encoded = image_url.split(',', 1)
+    return base64.b64decode(encoded)
+
+
+def _agent_failed(e: Exception) -> bool:
+    logging.error(f"Model test failed: {str(e)}", exc_info=True)
+    print(f"⚠️ Model test failed: {str(e)}")
+    return False
+
+
+def _save_agent_image(image_bytes: bytes, local_output_path) -> bytes:
+    image_bytes = to_output_jpeg(image_bytes)
+    with open(local_output_path, 'wb') as f:
+        f.write(image_bytes)
+    return image_bytes
+
+
+def generate_room_scene_with_agent(agent, original_prompt, product_data, local_output_path):
+    """Run the agent and save its image as JPEG to local_output_path
+
+    Returns the JPEG bytes, so callers can upload them without reading the file back, or False on failure.
+    """
     try:
-        final_state = agent.invoke(initial_state)
-        test_response = final_state['response']
-        logger.info("✓ Model is working! Generated test response successfully")
-        logger.info(f"  Response type: {type(test_response)}")
-        logger.info(
-            f"  Content preview: {str(test_response.content)[:200]}...")
+        image_url = _agent_response_image_url(agent.invoke(_agent_initial_state(original_prompt, product_data)))
     except Exception as e:
-        logging.error(f"Model test failed: {str(e)}", exc_info=True)
-        print(f"⚠️ Model test failed: {str(e)}")
+        return _agent_failed(e)
+    if image_url is None:
         return False
 
-    if test_response:
-        for resp in test_response.content:
-            if type(resp) == str:
-                print(resp)
-            elif type(resp) == dict:
-                if resp['type'] == 'image_url':
-                    image_url = resp['image_url']['url']
-
-                    if image_url.startswith('data:'):
-                        # Handle data URL
-                        header, encoded = image_url.split(',', 1)
-                        image_bytes = base64.b64decode(encoded)
-                    else:
-                        # Handle remote URL
-                        response = requests.get(image_url)
-                        response.raise_for_status()
-                        image_bytes = response.content
-
-                    with open(local_output_path, 'wb') as f:
-                        f.write(image_bytes)
-                    return True
-            else:
-                logger.warning(f"Unknown response type: {type(resp)} : {resp}")
+    image_bytes = _inline_image_bytes(image_url)
+    if image_bytes is None:
+        buf = BytesIO()
+        stream_url(image_url, buf)
+        image_bytes = buf.getvalue()
+    return _save_agent_image(image_bytes, local_output_path)
 
-    return False
 
+async def agenerate_room_scene_with_agent(agent, original_prompt, product_data, local_output_path):
+    """Async version of generate_room_scene_with_agent for running many products concurrently"""
+    try:
+        image_url = _agent_response_image_url(await agent.ainvoke(_agent_initial_state(original_prompt, product_data)))
+    except Exception as e:
+        return _agent_failed(e)
+    if image_url is None:
+        return False
+
+    image_bytes = _inline_image_bytes(image_url)
+    if image_bytes is None:
+        response = await _get_async_client().get(image_url)
+        response.raise_for_status()
+        image_bytes = response.content
+    return _save_agent_image(image_bytes, local_output_path)
+
+
+# OpenCV encoder settings per output MIME type
+_CV2_ENCODE_PARAMS = {
+    "image/jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+    "image/jpg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+    "image/png": (".png", []),
+    "image/webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 85]),
+}
+
+
+def _decode_image_bgr(image_data: bytes) -> np.ndarray:
+    """Decode image bytes to an 8-bit BGR array, flattening any transparency onto white"""
+    img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("Unable to decode image data")
+
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        alpha = img[:, :, 3:4].astype(np.float32) / 255.0
+        img = (img[:, :, :3].astype(np.float32) * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+
+    return img
+
+
+def pad_and_resize_image(image_data, mime_type, target_width, target_height, upload_mime="image/jpeg"):
+    """Pad and resize an image to the target size and encode it as upload_mime.
+
+    The image is decoded from its content, so mime_type is only checked for being an image type.
+    """
+    if mime_type and not mime_type.startswith("image/"):
+        raise ValueError(f"Unsupported MIME type: {mime_type}")
+    if upload_mime not in _CV2_ENCODE_PARAMS:
+        raise ValueError(f"Unsupported upload MIME type: {upload_mime}")
 
-def pad_and_resize_image(image_data, mime_type, target_width, target_height):
+    img = _decode_image_bgr(image_data)
+    height, width = img.shape[:2]
 
-    dims = get_image_dimensions(image_data, mime_type)
-    target_aspect_ratio = float(target_width) / float(target_height)
+    # Pad with white to the target aspect ratio, keeping the image centered
     dims = calculate_target_aspect_ratio_dimensions_upscale_only(
-        target_aspect_ratio=target_aspect_ratio, **dims)
-    dims = apply_min_dimensions(
-        min_width=target_width, min_height=target_height, **dims)
-    image_data = pad_image_to_size(
-        image_data=image_data, mime_type=mime_type, **dims)
-    image_data = downscale_image(
-        image_data=image_data, mime_type=mime_type, **dims)
-
-    return image_data
+        width=width, height=height,
+        target_aspect_ratio=float(target_width) / float(target_height))
+    pad_x = dims["width"] - width
+    pad_y = dims["height"] - height
+    img = cv2.copyMakeBorder(
+        img, pad_y // 2, pad_y - pad_y // 2, pad_x // 2, pad_x - pad_x // 2,
+        cv2.BORDER_CONSTANT, value=(255, 255, 255))
+
+    # INTER_AREA avoids aliasing when shrinking, INTER_CUBIC keeps edges sharp when enlarging
+    interpolation = cv2.INTER_AREA if dims["width"] > target_width else cv2.INTER_CUBIC
+    img = cv2.resize(img, (target_width, target_height), interpolation=interpolation)
+
+    extension, params = _CV2_ENCODE_PARAMS[upload_mime]
+    ok, encoded = cv2.imencode(extension, img, params)
+    if not ok:
+        raise ValueError(f"Failed to encode image as {upload_mime}")
+    return encoded.tobytes()
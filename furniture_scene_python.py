@@ -8,117 +8,274 @@ Customized for Overstock White Label Project
 from furniture_scene_generator import llm, services, config
 import pandas as pd
 
+from contextlib import contextmanager
+from io import BytesIO
 from pathlib import Path
-import time
+import asyncio
+import csv
+import os
 import sys
 
+
+# Sentinel that tells a pipeline worker to stop
+_DONE = object()
+
+# Columns of the progress checkpoint CSV (one row per uploaded image)
+_CHECKPOINT_FIELDS = ['WL', 'Lifestyle Image']
+
+
+def load_checkpoint(df, path):
+    """Fill in Lifestyle Image URLs recorded by an earlier, interrupted run so those rows are skipped"""
+    if not os.path.exists(path):
+        return 0
+
+    done = pd.read_csv(path, dtype=str).dropna().drop_duplicates('WL', keep='last')
+    urls = df['WL'].astype(str).map(done.set_index('WL')['Lifestyle Image'])
+    missing = df['Lifestyle Image'].isna() | (df['Lifestyle Image'].astype(str).str.strip() == '')
+    restore = missing & urls.notna()
+    df['Lifestyle Image'] = df['Lifestyle Image'].astype(object)
+    df.loc[restore, 'Lifestyle Image'] = urls[restore]
+    return int(restore.sum())
+
+
+@contextmanager
+def open_checkpoint(path):
+    """Yield a function that appends a (WL, URL) row to the checkpoint CSV and flushes it immediately"""
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8') as checkpoint_file:
+        writer = csv.writer(checkpoint_file)
+        if new_file:
+            writer.writerow(_CHECKPOINT_FIELDS)
+
+        def checkpoint(wl_model, public_url):
+            writer.writerow([wl_model, public_url])
+            checkpoint_file.flush()
+
+        yield checkpoint
+
+
+def prepare_product(df, columns, pos, output_dir, stats):
+    """Run the skip checks for the row at position pos and build its pipeline work item (or None)
+
+    columns holds the spreadsheet columns pre-extracted as NumPy arrays, plus the
+    services.product_values tuples under 'product' (see process_products).
+    """
+    wl_model = columns['WL'][pos]
+    silo_image_url = columns['Silo Image'][pos]
+    existing_lifestyle = columns['Lifestyle Image'][pos]
+
+    print(f"[{pos + 1}/{len(df)}] Queued: {wl_model}")
+    if columns['Model'] is not None:
+        print(f"  Model: {columns['Model'][pos]}")
+
+    # Skip if missing data
+    if pd.isna(wl_model) or pd.isna(silo_image_url) or not wl_model or not silo_image_url:
+        print("  ⏭️  Missing WL model or silo image, skipping...")
+        stats['skipped'] += 1
+        return None
+
+    # Skip if already has lifestyle image
+    if not pd.isna(existing_lifestyle) and str(existing_lifestyle).strip():
+        print("  ⏭️  Already has lifestyle image, skipping...")
+        stats['skipped'] += 1
+        return None
+
+    output_filename = f"{wl_model}_room.jpg"
+    return {
+        'idx': df.index[pos],
+        'wl_model': wl_model,
+        'prompt': services.create_place_image_in_room_prompt(),
+        'product_data': services.product_from_values(columns['product'][pos]),
+        'output_filename': output_filename,
+        'local_output_path': output_dir / output_filename,
+    }
+
+
+def record_failure(updates, item, error, stats):
+    print(f"  ❌ FAILED: {item['wl_model']}: {str(error)}")
+    updates[item['idx']] = f"ERROR: {str(error)}"
+    stats['errors'] += 1
+
+
+async def prefetch_worker(in_q, out_q):
+    """Stage 1: download the silo image ahead of generation so the agent finds it cached"""
+    while (item := await in_q.get()) is not _DONE:
+        try:
+            await services.get_image_url_data_async(item['product_data'].silo_image)
+        except Exception as e:
+            # The agent fetches (and reports) the image itself if the prefetch failed
+            print(f"  ⚠️  Prefetch failed for {item['wl_model']}: {str(e)}")
+        await out_q.put(item)
+
+
+async def improve_prompts(items, prompts_ready):
+    """Improve every queued prompt in batched model calls, then let the generate stage start
+
+    The agent's improve_prompt node reads the results from the prompt cache. If the batch
+    fails, each product's prompt is still improved by the agent itself.
+    """
+    try:
+        states = [{'original_prompt': item['prompt'], 'product_data': item['product_data']} for item in items]
+        await asyncio.to_thread(llm.improve_prompts, states)
+    except Exception as e:
+        print(f"  ⚠️  Batched prompt improvement failed: {str(e)}")
+    finally:
+        prompts_ready.set()
+
+
+async def generate_worker(agent, in_q, out_q, updates, stats, prompts_ready):
+    """Stage 2: generate the room scene with the agent"""
+    await prompts_ready.wait()
+    while (item := await in_q.get()) is not _DONE:
+        try:
+            print(f"  → Generating: {item['wl_model']}")
+            image_bytes = await services.agenerate_room_scene_with_agent(
+                agent, item['prompt'], item['product_data'], str(item['local_output_path']))
+            if not image_bytes:
+                raise Exception("No image was generated")
+            item['image_bytes'] = image_bytes
+            await out_q.put(item)
+        except Exception as e:
+            record_failure(updates, item, e, stats)
+
+
+async def upload_worker(pool, in_q, updates, stats, checkpoint):
+    """Stage 3: upload the generated image straight from memory and record its URL"""
+    while (item := await in_q.get()) is not _DONE:
+        try:
+            async with pool.connection() as sftp:
+                public_url = await services.aupload_to_sftp(
+                    BytesIO(item.pop('image_bytes')), item['output_filename'], sftp)
+
+            updates[item['idx']] = public_url
+            checkpoint(item['wl_model'], public_url)
+
+            print(f"  ✅ SUCCESS! {item['wl_model']} image URL: {public_url}")
+            stats['processed'] += 1
+        except Exception as e:
+            record_failure(updates, item, e, stats)
+
+
+async def _stop_stage(queue, workers):
+    for _ in workers:
+        await queue.put(_DONE)
+    await asyncio.gather(*workers)
+
+
+async def process_products(agent, df, output_dir, stats, checkpoint):
+    """Run rows through a prefetch -> generate -> upload pipeline of worker tasks
+
+    Each stage has its own worker count (config.PREFETCH_WORKERS, config.MAX_CONCURRENT_PRODUCTS,
+    config.UPLOAD_WORKERS), so downloads and uploads overlap with the slow generation step.
+    Prompts for all queued rows are improved in one batch first, overlapping the first prefetches.
+    checkpoint(wl_model, public_url) is called after every successful upload.
+    Resulting URLs (or errors) are written to the Lifestyle Image column in one go at the end.
+    """
+    # Pull the columns out once instead of going through a Series per row
+    columns = {
+        'WL': df['WL'].to_numpy(),
+        'Silo Image': df['Silo Image'].to_numpy(),
+        'Lifestyle Image': df['Lifestyle Image'].to_numpy(),
+        'Model': df['Model'].to_numpy() if 'Model' in df.columns else None,
+        'product': services.product_values(df),
+    }
+    updates = {}
+
+    prefetch_q = asyncio.Queue(maxsize=config.PREFETCH_WORKERS * 2)
+    generate_q = asyncio.Queue(maxsize=config.MAX_CONCURRENT_PRODUCTS)
+    upload_q = asyncio.Queue(maxsize=config.UPLOAD_WORKERS * 2)
+
+    items = [item for pos in range(len(df))
+             if (item := prepare_product(df, columns, pos, output_dir, stats)) is not None]
+
+    # Uploads reuse open SFTP sessions instead of connecting per product
+    async with services.SftpPool() as pool:
+        prompts_ready = asyncio.Event()
+        prompt_task = asyncio.create_task(improve_prompts(items, prompts_ready))
+        prefetchers = [asyncio.create_task(prefetch_worker(prefetch_q, generate_q))
+                       for _ in range(config.PREFETCH_WORKERS)]
+        generators = [asyncio.create_task(generate_worker(agent, generate_q, upload_q, updates, stats, prompts_ready))
+                      for _ in range(config.MAX_CONCURRENT_PRODUCTS)]
+        uploaders = [asyncio.create_task(upload_worker(pool, upload_q, updates, stats, checkpoint))
+                     for _ in range(config.UPLOAD_WORKERS)]
+
+        for item in items:
+            await prefetch_q.put(item)
+
+        # Shut the stages down in order once everything upstream has drained
+        await prompt_task
+        await _stop_stage(prefetch_q, prefetchers)
+        await _stop_stage(generate_q, generators)
+        await _stop_stage(upload_q, uploaders)
+
+    await services.aclose_async_client()
+
+    if updates:
+        df['Lifestyle Image'] = df['Lifestyle Image'].astype(object)
+        df.loc[list(updates), 'Lifestyle Image'] = list(updates.values())
+
+
 def main():
     """Main processing function"""
+    services.configure_logging()
     print("=" * 70)
     print("🪑 FURNITURE SCENE GENERATOR - Overstock White Label Project")
     print("=" * 70)
-    
+
     try:
         # Create output directory
         output_dir = Path('./output')
         output_dir.mkdir(exist_ok=True)
-        
+
         # Initialize Google Cloud clients
         print("\n🔧 Initializing Google Cloud clients...")
         vision_client, imagen_model = services.initialize_google_clients()
         print("✓ Clients initialized")
 
+        llm.warm_models()
         agent = llm.create_stage1_agent()
-        
+
 
         df = services.read_excel_file()
-        
+
         # Verify required columns
         required_columns = ['WL', 'Silo Image', 'Lifestyle Image']
         for col in required_columns:
             if col not in df.columns:
                 raise Exception(f"Column '{col}' not found in Excel file")
-        
-        print("\n📊 Processing products...\n")
-        
+
+        # Resume from the progress checkpoint of an interrupted run
+        restored = load_checkpoint(df, config.PROGRESS_CHECKPOINT_PATH)
+        if restored:
+            print(f"✓ Restored {restored} images from checkpoint: {config.PROGRESS_CHECKPOINT_PATH}")
+
+        print(f"\n📊 Processing products ({config.MAX_CONCURRENT_PRODUCTS} generating at a time)...\n")
+
         # Track statistics
-        processed = 0
-        skipped = 0
-        errors = 0
-        
-        # Process each product
-        for idx, row in df.iterrows():
-            wl_model = row['WL']
-            silo_image_url = row['Silo Image']
-            website_link = row.get('WebSite Link for Context', '')
-            existing_lifestyle = row.get('Lifestyle Image', '')
-
-            product_data = services.row_to_product_data(row)
-            
-            print(f"[{idx + 1}/{len(df)}] Processing: {wl_model}")
-            if 'Model' in df.columns:
-                print(f"  Model: {row['Model']}")
-            
-            try:
-                # Skip if missing data
-                if pd.isna(wl_model) or pd.isna(silo_image_url) or not wl_model or not silo_image_url:
-                    print("  ⏭️  Missing WL model or silo image, skipping...")
-                    skipped += 1
-                    continue
-                
-                # Skip if already has lifestyle image
-                if not pd.isna(existing_lifestyle) and str(existing_lifestyle).strip():
-                    print("  ⏭️  Already has lifestyle image, skipping...")
-                    skipped += 1
-                    continue
-                
-                # Step 1: Analyze product image
-                # No action needed, agent handles this
-
-                
-                # Step 2: Generate prompt
-                prompt = services.create_place_image_in_room_prompt()
-                
-                # Step 3: Generate room scene
-                output_filename = f"{wl_model}_room.png"
-                local_output_path = output_dir / output_filename
-                services.generate_room_scene_with_agent(agent, prompt, product_data, str(local_output_path))
-                
-                # Step 4: Upload to SFTP
-                public_url = services.upload_to_sftp(str(local_output_path), output_filename)
-                
-                # Step 5: Update DataFrame
-                df.at[idx, 'Lifestyle Image'] = public_url
-                
-                print(f"  ✅ SUCCESS! Image URL: {public_url}")
-                processed += 1
-                
-                # Add delay to respect rate limits
-                if idx < len(df) - 1:
-                    print("  ⏱️  Waiting 2 seconds before next product...")
-                    time.sleep(2)
-                
-            except Exception as e:
-                print(f"  ❌ FAILED: {str(e)}")
-                df.at[idx, 'Lifestyle Image'] = f"ERROR: {str(e)}"
-                errors += 1
-                continue
-        
+        stats = {'processed': 0, 'skipped': 0, 'errors': 0}
+
+        # Process products concurrently, checkpointing each finished upload so a crash loses no work
+        with open_checkpoint(config.PROGRESS_CHECKPOINT_PATH) as checkpoint:
+            asyncio.run(process_products(agent, df, output_dir, stats, checkpoint))
+
         # Save updated Excel file
         print(f"\n💾 Writing updated Excel file...")
         df.to_excel(config.EXCEL_OUTPUT_PATH, index=False)
         print(f"✓ Excel file updated: {config.EXCEL_OUTPUT_PATH}")
-        
+
+        # The updated workbook now holds every uploaded URL, so the checkpoint has done its job
+        Path(config.PROGRESS_CHECKPOINT_PATH).unlink(missing_ok=True)
+
         # Print summary
         print("\n" + "=" * 70)
         print("📊 PROCESSING COMPLETE - SUMMARY")
         print("=" * 70)
-        print(f"✅ Successfully processed: {processed} products")
-        print(f"⏭️  Skipped: {skipped} products")
-        print(f"❌ Errors: {errors} products")
+        print(f"✅ Successfully processed: {stats['processed']} products")
+        print(f"⏭️  Skipped: {stats['skipped']} products")
+        print(f"❌ Errors: {stats['errors']} products")
         print(f"📁 Output file: {config.EXCEL_OUTPUT_PATH}")
         print("=" * 70)
-        
+
     except Exception as e:
         print(f"\n❌ FATAL ERROR: {str(e)}")
         import traceback